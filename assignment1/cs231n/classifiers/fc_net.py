@@ -29,6 +29,7 @@ class TwoLayerNet(object):
         num_classes=10,
         weight_scale=1e-3,
         reg=0.0,
+        dtype=np.float64,
     ):
         """
         Initialize a new network.
@@ -40,9 +41,13 @@ class TwoLayerNet(object):
         - weight_scale: Scalar giving the standard deviation for random
           initialization of the weights.
         - reg: Scalar giving L2 regularization strength.
+        - dtype: A numpy datatype object; all computations will be performed using
+          this datatype. float32 is faster but less accurate, so you should use
+          float64 for numeric gradient checking.
         """
         self.params = {}
         self.reg = reg
+        self.dtype = dtype
 
         ############################################################################
         # TODO: Initialize the weights and biases of the two-layer net. Weights    #
@@ -65,6 +70,10 @@ class TwoLayerNet(object):
         #                             END OF YOUR CODE                             #
         ############################################################################
 
+        # Cast all parameters to the correct datatype.
+        for k, v in self.params.items():
+            self.params[k] = v.astype(dtype)
+
     def loss(self, X, y=None):
         """
         Compute loss and gradient for a minibatch of data.
@@ -84,6 +93,7 @@ class TwoLayerNet(object):
         - grads: Dictionary with the same keys as self.params, mapping parameter
           names to gradients of the loss with respect to those parameters.
         """
+        X = X.astype(self.dtype, copy=False)
         scores = None
 
         W1 = self.params['W1']
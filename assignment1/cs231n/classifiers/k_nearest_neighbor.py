@@ -1,16 +1,194 @@
 from builtins import range
 from builtins import object
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 from past.builtins import xrange
 
 
+def _merge_top_k(best_d, best_i, d, idx, k):
+    """
+    Merge a tile of squared distances into a running top-k.
+
+    Inputs:
+    - best_d, best_i: Arrays of shape (M, k) with the current k smallest
+      squared distances of each row and the matching training indices.
+    - d: Array of shape (M, P) of new squared distances.
+    - idx: Integer array of shape (P,) of training indices for the columns of d.
+    - k: Number of neighbors to keep.
+
+    Returns the updated (best_d, best_i); rows are not sorted.
+    """
+    cand_d = np.hstack((best_d, d))
+    cand_i = np.hstack((best_i, np.broadcast_to(idx, d.shape)))
+    top = np.argpartition(cand_d, k - 1, axis=1)[:, :k]
+    return np.take_along_axis(cand_d, top, axis=1), np.take_along_axis(cand_i, top, axis=1)
+
+
+def _finish_top_k(best_d, best_i):
+    """
+    Sort a running top-k by distance and turn squared distances into L2
+    distances. Returns a tuple (neighbors, dists).
+    """
+    order = np.argsort(best_d, axis=1)
+    best_d = np.take_along_axis(best_d, order, axis=1)
+    # Rounding can make squared distances slightly negative
+    np.maximum(best_d, 0, out=best_d)
+    return np.take_along_axis(best_i, order, axis=1), np.sqrt(best_d)
+
+
+class IVFIndex(object):
+    """
+    An approximate nearest-neighbor index based on an inverted file (IVF).
+
+    At build time the training points are clustered with k-means into
+    num_lists cells, and each point is stored in the list of its nearest
+    centroid. A query only scans the points in the num_probe lists whose
+    centroids are closest to it. num_probe is the recall/speed knob: probing
+    more lists finds more of the true neighbors but scans more points, and
+    num_probe = num_lists is an exact (if slower) search.
+    """
+
+    def __init__(self, num_lists=100, num_probe=8, num_iters=10, seed=None,
+                 chunk_size=1024):
+        """
+        Inputs:
+        - num_lists: Number of k-means cells.
+        - num_probe: Default number of cells scanned per query.
+        - num_iters: Number of Lloyd iterations used to fit the centroids.
+        - seed: Optional seed for the k-means initialization.
+        - chunk_size: Number of training points gathered at a time when the
+          centroids are updated.
+        """
+        self.num_lists = num_lists
+        self.num_probe = num_probe
+        self.num_iters = num_iters
+        self.seed = seed
+        self.chunk_size = chunk_size
+
+    def build(self, X):
+        """
+        Cluster X and build the inverted lists.
+
+        Inputs:
+        - X: A numpy array of shape (num_train, D) of training points.
+        """
+        rng = np.random.RandomState(self.seed)
+        self.dtype = np.result_type(X.dtype, np.float32)
+        self.X = X.astype(self.dtype, copy=False)
+        num_train = X.shape[0]
+        num_lists = min(self.num_lists, num_train)
+        self.squared = np.einsum("ij,ij->i", self.X, self.X)
+
+        centroids = self.X[rng.choice(num_train, num_lists, replace=False)].copy()
+        for _ in range(self.num_iters):
+            assign = self._assign(self.X, self.squared, centroids)
+            counts = np.bincount(assign, minlength=num_lists)
+            empty = counts == 0
+            # Sum the members of each cell with one reduceat over sorted rows
+            # per chunk, so that only a chunk of X is ever copied
+            sums = np.zeros_like(centroids)
+            for start in range(0, num_train, self.chunk_size):
+                chunk = assign[start : start + self.chunk_size]
+                chunk_counts = np.bincount(chunk, minlength=num_lists)
+                present = chunk_counts > 0
+                order = np.argsort(chunk, kind="stable")
+                starts = np.concatenate(([0], np.cumsum(chunk_counts)[:-1]))
+                sums[present] += np.add.reduceat(
+                    self.X[start : start + self.chunk_size][order],
+                    starts[present],
+                    axis=0,
+                )
+            centroids[~empty] = sums[~empty] / counts[~empty].reshape(-1, 1)
+            # Re-seed empty cells with random training points
+            centroids[empty] = self.X[rng.choice(num_train, empty.sum())]
+        self.centroids = centroids
+        assign = self._assign(self.X, self.squared, centroids)
+
+        # Store the lists in CSR form: the points of list l are
+        # self.order[self.offsets[l]:self.offsets[l + 1]].
+        self.order = np.argsort(assign, kind="stable")
+        self.offsets = np.searchsorted(assign[self.order], np.arange(num_lists + 1))
+        return self
+
+    def _assign(self, X, X_squared, centroids):
+        """ Index of the nearest centroid for each row of X """
+        d = X.dot(centroids.T)
+        d *= -2
+        d += np.sum(centroids ** 2, axis=1)
+        d += X_squared.reshape(-1, 1)
+        return np.argmin(d, axis=1)
+
+    def search(self, Q, k=1, num_probe=None):
+        """
+        Find approximate k nearest neighbors of each query.
+
+        Inputs:
+        - Q: A numpy array of shape (num_test, D) of queries.
+        - k: Number of neighbors to return.
+        - num_probe: Number of lists to scan per query; defaults to
+          self.num_probe.
+
+        Returns a tuple (neighbors, dists) with the same meaning as
+        KNearestNeighbor.compute_neighbors_blocked.
+        """
+        if num_probe is None:
+            num_probe = self.num_probe
+        num_lists = self.centroids.shape[0]
+        num_probe = min(num_probe, num_lists)
+        k = min(k, self.X.shape[0])
+        Q = Q.astype(self.dtype, copy=False)
+        num_test = Q.shape[0]
+        q_squared = np.sum(Q ** 2, axis=1)
+
+        d = Q.dot(self.centroids.T)
+        d *= -2
+        d += np.sum(self.centroids ** 2, axis=1)
+        probes = np.argpartition(d, num_probe - 1, axis=1)[:, :num_probe]
+
+        # Walk the lists rather than the queries, so that each step is one
+        # matrix multiply between a list and all the queries that probe it.
+        by_list = np.argsort(probes.ravel(), kind="stable")
+        list_ids = probes.ravel()[by_list]
+        query_ids = by_list // num_probe
+        bounds = np.searchsorted(list_ids, np.arange(num_lists + 1))
+
+        best_d = np.full((num_test, k), np.inf, dtype=self.dtype)
+        best_i = np.zeros((num_test, k), dtype=np.intp)
+        for l in range(num_lists):
+            rows = query_ids[bounds[l] : bounds[l + 1]]
+            members = self.order[self.offsets[l] : self.offsets[l + 1]]
+            if rows.size == 0 or members.size == 0:
+                continue
+            d = Q[rows].dot(self.X[members].T)
+            d *= -2
+            d += q_squared[rows].reshape(-1, 1)
+            d += self.squared[members]
+            best_d[rows], best_i[rows] = _merge_top_k(
+                best_d[rows], best_i[rows], d, members, k
+            )
+
+        # Queries whose probed lists held fewer than k points fall back to an
+        # exact scan so that every returned neighbor is real.
+        short = np.flatnonzero(np.isinf(best_d).any(axis=1))
+        if short.size > 0:
+            d = Q[short].dot(self.X.T)
+            d *= -2
+            d += q_squared[short].reshape(-1, 1)
+            d += self.squared
+            best_d[short] = np.inf
+            best_d[short], best_i[short] = _merge_top_k(
+                best_d[short], best_i[short], d, np.arange(self.X.shape[0]), k
+            )
+        return _finish_top_k(best_d, best_i)
+
+
 class KNearestNeighbor(object):
     """ a kNN classifier with L2 distance """
 
     def __init__(self):
-        pass
+        self.index = None
 
-    def train(self, X, y):
+    def train(self, X, y, index=None):
         """
         Train the classifier. For k-nearest neighbors this is just
         memorizing the training data.
@@ -20,11 +198,18 @@ class KNearestNeighbor(object):
           consisting of num_train samples each of dimension D.
         - y: A numpy array of shape (N,) containing the training labels, where
              y[i] is the label for X[i].
+        - index: Optional approximate nearest-neighbor index such as an
+          IVFIndex. If given, it is built on X here and predict() only scans
+          its candidate lists.
         """
         self.X_train = X
         self.y_train = y
+        self.index = index
+        if index is not None:
+            index.build(X)
 
-    def predict(self, X, k=1, num_loops=0):
+    def predict(self, X, k=1, num_loops=0, memory_budget=None, num_threads=1,
+                num_probe=None):
         """
         Predict labels for test data using this classifier.
 
@@ -34,11 +219,26 @@ class KNearestNeighbor(object):
         - k: The number of nearest neighbors that vote for the predicted labels.
         - num_loops: Determines which implementation to use to compute distances
           between training points and testing points.
+        - memory_budget: If not None (and num_loops is 0), never build the full
+          distance matrix; instead use compute_neighbors_blocked with tiles of
+          at most this many bytes.
+        - num_threads: Number of threads used by the blocked path.
+        - num_probe: If an index was given to train() (and num_loops is 0),
+          the number of index lists scanned per test point; defaults to the
+          index's own setting.
 
         Returns:
         - y: A numpy array of shape (num_test,) containing predicted labels for the
           test data, where y[i] is the predicted label for the test point X[i].
         """
+        if num_loops == 0 and self.index is not None:
+            neighbors, _ = self.index.search(X, k=k, num_probe=num_probe)
+            return self.vote_labels(self.y_train[neighbors])
+        if num_loops == 0 and memory_budget is not None:
+            neighbors, _ = self.compute_neighbors_blocked(
+                X, k=k, memory_budget=memory_budget, num_threads=num_threads
+            )
+            return self.vote_labels(self.y_train[neighbors])
         if num_loops == 0:
             dists = self.compute_distances_no_loops(X)
         elif num_loops == 1:
@@ -142,6 +342,139 @@ class KNearestNeighbor(object):
         # *****END OF YOUR CODE (DO NOT DELETE/MODIFY THIS LINE)*****
         return dists
 
+    def compute_neighbors_blocked(self, X, k=1, memory_budget=256 * 2 ** 20,
+                                  num_threads=1):
+        """
+        Find the k nearest training points of each test point without ever
+        materializing the full (num_test, num_train) distance matrix.
+
+        Test rows are processed in blocks and training points in tiles so that
+        each block's temporaries fit in memory_budget bytes. Only a running
+        top-k (found with np.argpartition) is kept per test row. Blocks can be
+        run on a thread pool, since the matrix multiply releases the GIL.
+
+        Inputs:
+        - X: A numpy array of shape (num_test, D) containing test data.
+        - k: Number of neighbors to return for each test point.
+        - memory_budget: Approximate number of bytes of scratch space to use
+          across all threads.
+        - num_threads: Number of threads used to process blocks of test rows.
+
+        Returns a tuple of:
+        - neighbors: Integer array of shape (num_test, k); neighbors[i] holds
+          the indices into self.X_train of the k nearest training points to
+          X[i], sorted by increasing distance.
+        - dists: Array of shape (num_test, k) of the matching L2 distances.
+        """
+        num_test, D = X.shape
+        num_train = self.X_train.shape[0]
+        k = min(k, num_train)
+        dtype = np.result_type(X.dtype, self.X_train.dtype, np.float32)
+
+        # Each element of a distance tile needs the tile itself, the merged
+        # candidate distances, and two index arrays (the merged candidate
+        # indices and the argpartition result). Each training point of a tile
+        # and each test row of a block may also need a copy in dtype.
+        index_size = np.dtype(np.intp).itemsize
+        elem_bytes = 2 * dtype.itemsize + 2 * index_size
+        point_bytes = D * dtype.itemsize
+        train_point_bytes = point_bytes if self.X_train.dtype != dtype else 0
+        thread_budget = memory_budget // num_threads
+        col_block = min(
+            num_train,
+            max(thread_budget // (elem_bytes + train_point_bytes + point_bytes), k + 1),
+        )
+        row_block = max(
+            1,
+            (thread_budget - col_block * train_point_bytes)
+            // (col_block * elem_bytes + point_bytes),
+        )
+
+        # Squared norms of the training points, one tile at a time so that
+        # X_train is never copied as a whole
+        train_squared = np.empty(num_train, dtype=dtype)
+        for col in range(0, num_train, col_block):
+            X_tile = self.X_train[col : col + col_block].astype(dtype, copy=False)
+            train_squared[col : col + col_block] = np.einsum("ij,ij->i", X_tile, X_tile)
+
+        neighbors = np.empty((num_test, k), dtype=np.intp)
+        dists = np.empty((num_test, k), dtype=dtype)
+
+        def process(start):
+            stop = min(start + row_block, num_test)
+            X_block = X[start:stop].astype(dtype, copy=False)
+            test_squared = np.einsum("ij,ij->i", X_block, X_block).reshape(-1, 1)
+            best_d = np.full((stop - start, k), np.inf, dtype=dtype)
+            best_i = np.zeros((stop - start, k), dtype=np.intp)
+            for col in range(0, num_train, col_block):
+                X_tile = self.X_train[col : col + col_block]
+                d = X_block.dot(X_tile.T.astype(dtype, copy=False))
+                d *= -2
+                d += test_squared
+                d += train_squared[col : col + col_block]
+                idx = np.arange(col, col + d.shape[1])
+                best_d, best_i = _merge_top_k(best_d, best_i, d, idx, k)
+            neighbors[start:stop], dists[start:stop] = _finish_top_k(best_d, best_i)
+
+        starts = range(0, num_test, row_block)
+        if num_threads > 1:
+            with ThreadPoolExecutor(max_workers=num_threads) as executor:
+                list(executor.map(process, starts))
+        else:
+            for start in starts:
+                process(start)
+        return neighbors, dists
+
+    def measure_recall(self, X, k=1, num_probe=None, memory_budget=256 * 2 ** 20):
+        """
+        Measure how well the index given to train() recovers the exact
+        nearest neighbors.
+
+        Inputs:
+        - X: A numpy array of shape (num_test, D) of test points.
+        - k: Number of neighbors to compare.
+        - num_probe: Number of index lists scanned per test point.
+        - memory_budget: Scratch space for the exact search, as in
+          compute_neighbors_blocked.
+
+        Returns:
+        - recall: Fraction of the exact k nearest neighbors that the index
+          also returned, averaged over the test points.
+        """
+        if self.index is None:
+            raise ValueError("measure_recall needs an index passed to train()")
+        approx, _ = self.index.search(X, k=k, num_probe=num_probe)
+        exact, _ = self.compute_neighbors_blocked(X, k=k, memory_budget=memory_budget)
+        num_test = X.shape[0]
+        # Offset indices by row so one np.isin compares every row at once
+        offsets = self.X_train.shape[0] * np.arange(num_test).reshape(-1, 1)
+        found = np.isin(exact + offsets, approx + offsets)
+        return found.mean()
+
+    def vote_labels(self, closest_y):
+        """
+        Majority vote over the labels of each test point's nearest neighbors,
+        breaking ties by choosing the smaller label.
+
+        Inputs:
+        - closest_y: Integer array of shape (num_test, k) of neighbor labels.
+
+        Returns:
+        - y: A numpy array of shape (num_test,) of predicted labels.
+        """
+        num_test = closest_y.shape[0]
+        num_classes = int(closest_y.max()) + 1 if closest_y.size > 0 else 1
+        # Offset each row's labels into its own range of num_classes bins so a
+        # single bincount produces the whole (num_test, num_classes) table.
+        offsets = num_classes * np.arange(num_test).reshape(-1, 1)
+        counts = np.bincount(
+            (closest_y + offsets).ravel(), minlength=num_test * num_classes
+        ).reshape(num_test, num_classes)
+        # argmax returns the first maximum, i.e. the smallest label on ties
+        y_pred = np.zeros(num_test)
+        y_pred[:] = np.argmax(counts, axis=1)
+        return y_pred
+
     def predict_labels(self, dists, k=1):
         """
         Given a matrix of distances between test points and training points,
@@ -155,37 +488,39 @@ class KNearestNeighbor(object):
         - y: A numpy array of shape (num_test,) containing predicted labels for the
           test data, where y[i] is the predicted label for the test point X[i].
         """
-        num_test = dists.shape[0]
-        y_pred = np.zeros(num_test)
-        for i in range(num_test):
-            # A list of length k storing the labels of the k nearest neighbors to
-            # the ith test point.
-            closest_y = []
-            #########################################################################
-            # TODO:                                                                 #
-            # Use the distance matrix to find the k nearest neighbors of the ith    #
-            # testing point, and use self.y_train to find the labels of these       #
-            # neighbors. Store these labels in closest_y.                           #
-            # Hint: Look up the function numpy.argsort.                             #
-            #########################################################################
-            # *****START OF YOUR CODE (DO NOT DELETE/MODIFY THIS LINE)*****
+        num_test, num_train = dists.shape
+        # A (num_test, k) array storing the labels of the k nearest neighbors of
+        # every test point.
+        closest_y = []
+        #########################################################################
+        # TODO:                                                                 #
+        # Use the distance matrix to find the k nearest neighbors of the ith    #
+        # testing point, and use self.y_train to find the labels of these       #
+        # neighbors. Store these labels in closest_y.                           #
+        # Hint: Look up the function numpy.argsort.                             #
+        #########################################################################
+        # *****START OF YOUR CODE (DO NOT DELETE/MODIFY THIS LINE)*****
 
-            closest_index = np.argsort(dists[i])[0 : k]
-            closest_y = self.y_train[closest_index]
+        # argpartition only needs to find the k smallest entries of each row,
+        # which is much cheaper than a full argsort.
+        if k < num_train:
+            closest_index = np.argpartition(dists, k - 1, axis=1)[:, :k]
+        else:
+            closest_index = np.broadcast_to(np.arange(num_train), dists.shape)
+        closest_y = self.y_train[closest_index]
 
-            # *****END OF YOUR CODE (DO NOT DELETE/MODIFY THIS LINE)*****
-            #########################################################################
-            # TODO:                                                                 #
-            # Now that you have found the labels of the k nearest neighbors, you    #
-            # need to find the most common label in the list closest_y of labels.   #
-            # Store this label in y_pred[i]. Break ties by choosing the smaller     #
-            # label.                                                                #
-            #########################################################################
-            # *****START OF YOUR CODE (DO NOT DELETE/MODIFY THIS LINE)*****
+        # *****END OF YOUR CODE (DO NOT DELETE/MODIFY THIS LINE)*****
+        #########################################################################
+        # TODO:                                                                 #
+        # Now that you have found the labels of the k nearest neighbors, you    #
+        # need to find the most common label in the list closest_y of labels.   #
+        # Store this label in y_pred[i]. Break ties by choosing the smaller     #
+        # label.                                                                #
+        #########################################################################
+        # *****START OF YOUR CODE (DO NOT DELETE/MODIFY THIS LINE)*****
 
-            counts = np.bincount(closest_y)
-            y_pred[i] = np.argmax(counts)
+        y_pred = self.vote_labels(closest_y)
 
-            # *****END OF YOUR CODE (DO NOT DELETE/MODIFY THIS LINE)*****
+        # *****END OF YOUR CODE (DO NOT DELETE/MODIFY THIS LINE)*****
 
         return y_pred
@@ -5,12 +5,15 @@ from builtins import object
 import numpy as np
 from ..classifiers.linear_svm import *
 from ..classifiers.softmax import *
+from ..classifiers.loss_workspace import LossWorkspace
 from past.builtins import xrange
 
 
 class LinearClassifier(object):
     def __init__(self):
         self.W = None
+        # Scratch buffers reused by the fused loss on every training step
+        self.workspace = LossWorkspace()
 
     def train(
         self,
@@ -21,6 +24,7 @@ class LinearClassifier(object):
         num_iters=100,
         batch_size=200,
         verbose=False,
+        dtype=None,
     ):
         """
         Train this linear classifier using stochastic gradient descent.
@@ -35,6 +39,9 @@ class LinearClassifier(object):
         - num_iters: (integer) number of steps to take when optimizing
         - batch_size: (integer) number of training examples to use at each step.
         - verbose: (boolean) If true, print progress during optimization.
+        - dtype: (numpy dtype) dtype of the weights and of all computation, e.g.
+          np.float32 for the faster single-precision path. Defaults to the dtype
+          of W, or float64 if W has not been initialized yet.
 
         Outputs:
         A list containing the value of the loss function at each training iteration.
@@ -46,6 +53,14 @@ class LinearClassifier(object):
         if self.W is None:
             # lazily initialize W
             self.W = 0.001 * np.random.randn(dim, num_classes)
+        if dtype is not None:
+            self.W = self.W.astype(dtype, copy=False)
+
+        # Minibatches are gathered into reused buffers of the weight dtype
+        X_gather = self.workspace.get("X_gather", (batch_size, dim), X.dtype)
+        X_cast = X_gather
+        if X.dtype != self.W.dtype:
+            X_cast = self.workspace.get("X_batch", (batch_size, dim), self.W.dtype)
 
         # Run stochastic gradient descent to optimize W
         loss_history = []
@@ -67,8 +82,12 @@ class LinearClassifier(object):
             # *****START OF YOUR CODE (DO NOT DELETE/MODIFY THIS LINE)*****
 
             indices = np.random.choice(num_train, batch_size, replace=True)
-            X_batch = X[indices]
+            # The indices are in range, so mode="clip" only skips the checks
+            X_batch = np.take(X, indices, axis=0, out=X_gather, mode="clip")
             y_batch = y[indices]
+            if X_cast is not X_gather:
+                np.copyto(X_cast, X_gather)
+                X_batch = X_cast
 
             # *****END OF YOUR CODE (DO NOT DELETE/MODIFY THIS LINE)*****
 
@@ -83,7 +102,9 @@ class LinearClassifier(object):
             #########################################################################
             # *****START OF YOUR CODE (DO NOT DELETE/MODIFY THIS LINE)*****
 
-            self.W -= learning_rate * grad
+            # grad is a workspace buffer, so it can be scaled in place
+            grad *= learning_rate
+            self.W -= grad
 
             # *****END OF YOUR CODE (DO NOT DELETE/MODIFY THIS LINE)*****
 
@@ -132,7 +153,8 @@ class LinearClassifier(object):
 
         Returns: A tuple containing:
         - loss as a single float
-        - gradient with respect to self.W; an array of the same shape as W
+        - gradient with respect to self.W; an array of the same shape as W. This
+          may be a buffer in self.workspace that the next call overwrites.
         """
         pass
 
@@ -141,11 +163,129 @@ class LinearSVM(LinearClassifier):
     """ A subclass that uses the Multiclass SVM loss function """
 
     def loss(self, X_batch, y_batch, reg):
-        return svm_loss_vectorized(self.W, X_batch, y_batch, reg)
+        return svm_loss_fused(self.W, X_batch, y_batch, reg, self.workspace)
 
 
 class Softmax(LinearClassifier):
     """ A subclass that uses the Softmax + Cross-entropy loss function """
 
     def loss(self, X_batch, y_batch, reg):
-        return softmax_loss_vectorized(self.W, X_batch, y_batch, reg)
+        return softmax_loss_fused(self.W, X_batch, y_batch, reg, self.workspace)
+
+
+class MultiLinearClassifier(object):
+    """
+    M linear classifiers of the same kind trained side by side, for instance
+    the points of a hyperparameter sweep. All models see the same minibatch at
+    every step, so their scores and gradients each come from one large matrix
+    product rather than M small ones, while every model keeps its own learning
+    rate and regularization strength.
+
+    self.W has shape (M, D, C); it is stored as a transposed view of a
+    (D, M, C) array so that all M weight matrices form one (D, M * C) matrix.
+    """
+
+    def __init__(self):
+        self.W = None
+
+    def train(
+        self,
+        X,
+        y,
+        learning_rates,
+        regs,
+        num_iters=100,
+        batch_size=200,
+        verbose=False,
+    ):
+        """
+        Train all models using stochastic gradient descent on shared minibatches.
+
+        Inputs:
+        - X, y, num_iters, batch_size, verbose: Same as LinearClassifier.train.
+        - learning_rates: Array of shape (M,) of per-model learning rates.
+        - regs: Array of shape (M,) of per-model regularization strengths.
+
+        Outputs:
+        An array of shape (num_iters, M) with the loss of every model at each
+        training iteration.
+        """
+        learning_rates, regs = np.broadcast_arrays(
+            np.atleast_1d(np.asarray(learning_rates, dtype=float)),
+            np.atleast_1d(np.asarray(regs, dtype=float)),
+        )
+        num_models = learning_rates.shape[0]
+        num_train, dim = X.shape
+        num_classes = np.max(y) + 1
+        if self.W is None:
+            # lazily initialize W
+            W = 0.001 * np.random.randn(dim, num_models, num_classes)
+            self.W = W.transpose(1, 0, 2)
+
+        loss_history = []
+        for it in range(num_iters):
+            indices = np.random.choice(num_train, batch_size, replace=True)
+            X_batch = X[indices]
+            y_batch = y[indices]
+
+            loss, grad = self.loss(X_batch, y_batch, regs)
+            loss_history.append(loss)
+
+            grad *= learning_rates[:, None, None]
+            self.W -= grad
+
+            if verbose and it % 100 == 0:
+                print(
+                    "iteration %d / %d: best loss %f"
+                    % (it, num_iters, np.nanmin(loss))
+                )
+
+        return np.array(loss_history)
+
+    def predict(self, X):
+        """
+        Predict labels for X with every model.
+
+        Returns:
+        - y_pred: Integer array of shape (M, N); y_pred[m] holds the labels
+          predicted by model m.
+        """
+        num_models, dim, num_classes = self.W.shape
+        W_cols = self.W.transpose(1, 0, 2).reshape(dim, -1)
+        scores = X.dot(W_cols).reshape(X.shape[0], num_models, num_classes)
+        return np.argmax(scores, axis=2).T
+
+    def classifier(self, m):
+        """ Return model m as a standalone LinearClassifier of the matching kind """
+        classifier = self.single_class()
+        classifier.W = self.W[m].copy()
+        return classifier
+
+    def loss(self, X_batch, y_batch, regs):
+        """
+        Compute the loss of every model and the derivatives.
+        Subclasses will override this.
+
+        Returns: A tuple containing:
+        - loss: Array of shape (M,)
+        - gradient with respect to self.W; an array of shape (M, D, C)
+        """
+        pass
+
+
+class MultiLinearSVM(MultiLinearClassifier):
+    """ M LinearSVM models trained at once """
+
+    single_class = LinearSVM
+
+    def loss(self, X_batch, y_batch, regs):
+        return svm_loss_multi(self.W, X_batch, y_batch, regs)
+
+
+class MultiSoftmax(MultiLinearClassifier):
+    """ M Softmax models trained at once """
+
+    single_class = Softmax
+
+    def loss(self, X_batch, y_batch, regs):
+        return softmax_loss_multi(self.W, X_batch, y_batch, regs)
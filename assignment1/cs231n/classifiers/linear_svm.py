@@ -2,6 +2,7 @@ from builtins import range
 import numpy as np
 from random import shuffle
 from past.builtins import xrange
+from .loss_workspace import LossWorkspace
 
 
 def svm_loss_naive(W, X, y, reg):
@@ -112,3 +113,103 @@ def svm_loss_vectorized(W, X, y, reg):
     # *****END OF YOUR CODE (DO NOT DELETE/MODIFY THIS LINE)*****
 
     return loss, dW
+
+
+def svm_loss_fused(W, X, y, reg, workspace=None):
+    """
+    Structured SVM loss function, fused single-pass implementation.
+
+    Computes the same loss and gradient as svm_loss_vectorized, but the
+    margins, the margin mask and the gradient all live in buffers taken from
+    workspace and are updated in place, so repeated calls with the same
+    shapes do not allocate any (N, C) or (D, C) temporaries. Everything is
+    computed in the dtype of W, so float32 inputs stay float32.
+    X is cast to the dtype of W (into a workspace buffer) if it differs.
+
+    Inputs are the same as svm_loss_naive, plus:
+    - workspace: A LossWorkspace holding the scratch buffers; a new one is
+      used if this is None.
+
+    Returns a tuple of:
+    - loss as single float
+    - gradient with respect to weights W. When a workspace is given this is
+      one of its buffers and is overwritten by the next call.
+    """
+    if workspace is None:
+        workspace = LossWorkspace()
+    num_train, dim = X.shape
+    num_classes = W.shape[1]
+    dtype = W.dtype
+    rows = workspace.arange(num_train)
+    if X.dtype != dtype:
+        # np.dot(..., out=...) needs operands of the output's dtype
+        X_cast = workspace.get("X", X.shape, dtype)
+        X_cast[...] = X
+        X = X_cast
+
+    margins = workspace.get("scores", (num_train, num_classes), dtype)
+    np.dot(X, W, out=margins)
+    correct = workspace.get("correct", (num_train, 1), dtype)
+    correct[:, 0] = margins[rows, y]
+    margins -= correct
+    margins += 1
+    np.maximum(margins, 0, out=margins)
+    margins[rows, y] = 0
+    loss = margins.sum() / num_train + reg * np.vdot(W, W)
+
+    # Turn the margins into the gradient of the loss w.r.t. the scores
+    np.greater(margins, 0, out=margins)
+    np.sum(margins, axis=1, keepdims=True, out=correct)
+    margins[rows, y] = -correct[:, 0]
+    margins /= num_train
+
+    dW = workspace.get("dW", (dim, num_classes), dtype)
+    np.dot(X.T, margins, out=dW)
+    reg_grad = workspace.get("reg_grad", (dim, num_classes), dtype)
+    np.multiply(W, 2 * reg, out=reg_grad)
+    dW += reg_grad
+
+    return float(loss), dW
+
+
+def svm_loss_multi(W, X, y, reg):
+    """
+    Structured SVM loss function for M models evaluated on the same minibatch.
+
+    The weights of all models are multiplied with X in one (N, D) x (D, M * C)
+    matrix product, and the gradients are computed with one more, instead of
+    one small product per model.
+
+    Inputs:
+    - W: A numpy array of shape (M, D, C) containing the weights of M models.
+      Ideally this is a transposed view of a C-contiguous (D, M, C) array (as
+      MultiLinearClassifier keeps it), so that no copy is needed to form the
+      (D, M * C) matrix.
+    - X: A numpy array of shape (N, D) containing a minibatch of data.
+    - y: A numpy array of shape (N,) containing training labels.
+    - reg: Scalar or array of shape (M,) of per-model regularization strengths.
+
+    Returns a tuple of:
+    - loss: Array of shape (M,) with the loss of each model.
+    - gradient with respect to W; an array of shape (M, D, C).
+    """
+    num_models, dim, num_classes = W.shape
+    num_train = X.shape[0]
+    rows = np.arange(num_train)
+    reg = np.broadcast_to(np.asarray(reg, dtype=W.dtype), (num_models,))
+    W_cols = W.transpose(1, 0, 2).reshape(dim, num_models * num_classes)
+
+    scores = X.dot(W_cols).reshape(num_train, num_models, num_classes)
+    correct_class_scores = scores[rows, :, y]
+    margins = np.maximum(0, scores - correct_class_scores[:, :, None] + 1)
+    margins[rows, :, y] = 0
+    loss = margins.sum(axis=(0, 2)) / num_train
+    loss += reg * np.einsum("mdc,mdc->m", W, W)
+
+    binary = (margins > 0).astype(W.dtype)
+    binary[rows, :, y] = -binary.sum(axis=2)
+    dW = X.T.dot(binary.reshape(num_train, -1)) / num_train
+    dW = dW.reshape(dim, num_models, num_classes).transpose(1, 0, 2)
+    dW += 2 * reg[:, None, None] * W
+
+    return loss, dW
@@ -0,0 +1,37 @@
+from builtins import object
+import numpy as np
+
+
+class LossWorkspace(object):
+    """
+    A set of named scratch buffers that the fused loss functions reuse from
+    one call to the next. A buffer is only reallocated when the requested
+    shape or dtype changes, so a training loop with a fixed batch size stops
+    allocating after its first iteration.
+
+    Arrays returned by get() (and therefore any loss or gradient computed in
+    a workspace) are overwritten by the next call that uses the same name.
+    """
+
+    def __init__(self):
+        self.buffers = {}
+
+    def get(self, name, shape, dtype):
+        """
+        Return an uninitialized C-contiguous buffer called name with the given
+        shape and dtype.
+        """
+        dtype = np.dtype(dtype)
+        buf = self.buffers.get(name)
+        if buf is None or buf.shape != tuple(shape) or buf.dtype != dtype:
+            buf = np.empty(shape, dtype=dtype)
+            self.buffers[name] = buf
+        return buf
+
+    def arange(self, n):
+        """ Return a cached np.arange(n), used for (row, label) indexing """
+        rows = self.buffers.get("arange")
+        if rows is None or rows.shape[0] != n:
+            rows = np.arange(n)
+            self.buffers["arange"] = rows
+        return rows
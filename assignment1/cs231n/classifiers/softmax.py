@@ -2,6 +2,7 @@ from builtins import range
 import numpy as np
 from random import shuffle
 from past.builtins import xrange
+from .loss_workspace import LossWorkspace
 
 
 def softmax_loss_naive(W, X, y, reg):
@@ -120,3 +121,91 @@ def softmax_loss_vectorized(W, X, y, reg):
     # *****END OF YOUR CODE (DO NOT DELETE/MODIFY THIS LINE)*****
 
     return loss, dW
+
+
+def softmax_loss_fused(W, X, y, reg, workspace=None):
+    """
+    Softmax loss function, fused single-pass implementation.
+
+    Computes the same loss and gradient as softmax_loss_vectorized, but the
+    scores are turned into probabilities and then into the gradient of the
+    scores in place, inside buffers taken from workspace, so repeated calls
+    with the same shapes do not allocate any (N, C) or (D, C) temporaries.
+    Everything is computed in the dtype of W, so float32 inputs stay float32.
+    X is cast to the dtype of W (into a workspace buffer) if it differs.
+
+    Inputs are the same as softmax_loss_naive, plus:
+    - workspace: A LossWorkspace holding the scratch buffers; a new one is
+      used if this is None.
+
+    Returns a tuple of:
+    - loss as single float
+    - gradient with respect to weights W. When a workspace is given this is
+      one of its buffers and is overwritten by the next call.
+    """
+    if workspace is None:
+        workspace = LossWorkspace()
+    num_train, dim = X.shape
+    num_classes = W.shape[1]
+    dtype = W.dtype
+    rows = workspace.arange(num_train)
+    if X.dtype != dtype:
+        # np.dot(..., out=...) needs operands of the output's dtype
+        X_cast = workspace.get("X", X.shape, dtype)
+        X_cast[...] = X
+        X = X_cast
+
+    probs = workspace.get("scores", (num_train, num_classes), dtype)
+    np.dot(X, W, out=probs)
+    row = workspace.get("correct", (num_train, 1), dtype)
+    np.max(probs, axis=1, keepdims=True, out=row)
+    probs -= row
+    np.exp(probs, out=probs)
+    np.sum(probs, axis=1, keepdims=True, out=row)
+    probs /= row
+
+    loss = -np.sum(np.log(probs[rows, y])) / num_train
+    loss += 0.5 * reg * np.vdot(W, W)
+
+    probs[rows, y] -= 1
+    probs /= num_train
+
+    dW = workspace.get("dW", (dim, num_classes), dtype)
+    np.dot(X.T, probs, out=dW)
+    reg_grad = workspace.get("reg_grad", (dim, num_classes), dtype)
+    np.multiply(W, reg, out=reg_grad)
+    dW += reg_grad
+
+    return float(loss), dW
+
+
+def softmax_loss_multi(W, X, y, reg):
+    """
+    Softmax loss function for M models evaluated on the same minibatch.
+
+    The weights of all models are multiplied with X in one (N, D) x (D, M * C)
+    matrix product, and the gradients are computed with one more, instead of
+    one small product per model.
+
+    Inputs and outputs are the same as svm_loss_multi.
+    """
+    num_models, dim, num_classes = W.shape
+    num_train = X.shape[0]
+    rows = np.arange(num_train)
+    reg = np.broadcast_to(np.asarray(reg, dtype=W.dtype), (num_models,))
+    W_cols = W.transpose(1, 0, 2).reshape(dim, num_models * num_classes)
+
+    scores = X.dot(W_cols).reshape(num_train, num_models, num_classes)
+    scores -= np.max(scores, axis=2, keepdims=True)
+    probs = np.exp(scores)
+    probs /= np.sum(probs, axis=2, keepdims=True)
+
+    loss = -np.sum(np.log(probs[rows, :, y]), axis=0) / num_train
+    loss += 0.5 * reg * np.einsum("mdc,mdc->m", W, W)
+
+    probs[rows, :, y] -= 1
+    dW = X.T.dot(probs.reshape(num_train, -1)) / num_train
+    dW = dW.reshape(dim, num_models, num_classes).transpose(1, 0, 2)
+    dW += reg[:, None, None] * W
+
+    return loss, dW
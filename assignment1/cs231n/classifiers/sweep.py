@@ -0,0 +1,185 @@
+from __future__ import print_function
+
+from builtins import range
+import math
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+# Memory-mapped training and validation arrays, opened once per worker by
+# _init_sweep_worker and shared read-only through the OS page cache.
+_sweep_data = {}
+
+
+def _init_sweep_worker(data_dir):
+    for name in ["X_train", "y_train", "X_val", "y_val"]:
+        _sweep_data[name] = np.load(
+            os.path.join(data_dir, "%s.npy" % name), mmap_mode="r"
+        )
+
+
+def _run_sweep_task(task):
+    """
+    Train one configuration for a number of additional iterations, starting
+    from the weights it reached in the previous rung, and evaluate it.
+    """
+    classifier_class, lr, reg, W, num_iters, batch_size, dtype, seed = task
+    np.random.seed(seed)
+    classifier = classifier_class()
+    classifier.W = W
+    loss_history = classifier.train(
+        _sweep_data["X_train"],
+        _sweep_data["y_train"],
+        learning_rate=lr,
+        reg=reg,
+        num_iters=num_iters,
+        batch_size=batch_size,
+        dtype=dtype,
+    )
+    loss = loss_history[-1]
+    if not np.isfinite(loss) or not np.all(np.isfinite(classifier.W)):
+        # Diverged; rank it below everything else
+        return classifier.W, loss, 0.0, 0.0
+    train_acc = float(np.mean(classifier.predict(_sweep_data["X_train"]) == _sweep_data["y_train"]))
+    val_acc = float(np.mean(classifier.predict(_sweep_data["X_val"]) == _sweep_data["y_val"]))
+    return classifier.W, loss, train_acc, val_acc
+
+
+def linear_classifier_sweep(
+    classifier_class,
+    X_train,
+    y_train,
+    X_val,
+    y_val,
+    learning_rates,
+    regularization_strengths,
+    num_iters=1500,
+    batch_size=200,
+    eta=3,
+    num_workers=None,
+    dtype=None,
+    seed=0,
+    verbose=False,
+):
+    """
+    Tune a LinearClassifier subclass over a learning rate x regularization
+    grid on a pool of worker processes, stopping clearly bad configurations
+    early with successive halving.
+
+    The training and validation arrays are written once to .npy files and
+    memory-mapped read-only by every worker, so they are not copied per
+    process. Training runs in rungs: every configuration first gets a small
+    share of num_iters iterations, then only the best 1 / eta of them (by
+    validation accuracy) keep training, from where they stopped, in the next
+    rung, until the survivors have trained for num_iters iterations in total.
+
+    Each worker process also runs a multithreaded BLAS; for big grids it can
+    help to limit it to one thread (e.g. OMP_NUM_THREADS=1).
+
+    Inputs:
+    - classifier_class: A LinearClassifier subclass such as LinearSVM or
+      Softmax.
+    - X_train, y_train, X_val, y_val: Training and validation data, as for
+      LinearClassifier.train.
+    - learning_rates, regularization_strengths: Lists of values to try.
+    - num_iters: Total number of iterations for configurations that survive
+      every rung.
+    - batch_size: Minibatch size passed to train().
+    - eta: Fraction of configurations dropped at every rung is 1 - 1 / eta.
+      eta <= 1 trains every configuration for num_iters iterations.
+    - num_workers: Number of worker processes; defaults to os.cpu_count().
+    - dtype: Optional dtype passed to train(), e.g. np.float32.
+    - seed: Base random seed; each (configuration, rung) is seeded from it.
+    - verbose: Boolean; if true, print the results of every rung.
+
+    Returns a tuple of:
+    - results: Dictionary mapping (learning_rate, reg) to a tuple
+      (train_accuracy, val_accuracy) for the last rung that the configuration
+      reached, as in the notebooks.
+    - best_classifier: A classifier_class instance holding the weights of the
+      configuration with the best validation accuracy, or None if the grid is
+      empty.
+    - iterations: Dictionary mapping (learning_rate, reg) to the number of
+      iterations that the configuration was trained for.
+    """
+    configs = [(lr, reg) for lr in learning_rates for reg in regularization_strengths]
+    num_configs = len(configs)
+    if num_configs == 0:
+        return {}, None, {}
+    num_rungs = 1
+    if eta > 1 and num_configs > 1:
+        num_rungs = int(math.floor(math.log(num_configs) / math.log(eta))) + 1
+    # Cumulative iterations that configurations alive in each rung reach. When
+    # num_iters is small several rungs can round to the same count; those are
+    # merged, so that every rung trains for at least one more iteration.
+    targets = sorted(
+        set(max(1, num_iters // eta ** (num_rungs - 1 - r)) for r in range(num_rungs))
+    )
+    num_rungs = len(targets)
+
+    data_dir = tempfile.mkdtemp()
+    try:
+        for name, arr in [
+            ("X_train", X_train),
+            ("y_train", y_train),
+            ("X_val", X_val),
+            ("y_val", y_val),
+        ]:
+            np.save(os.path.join(data_dir, "%s.npy" % name), arr)
+
+        if num_workers is None:
+            num_workers = os.cpu_count() or 1
+        pool = multiprocessing.Pool(
+            min(num_workers, num_configs), _init_sweep_worker, (data_dir,)
+        )
+        try:
+            alive = list(range(num_configs))
+            weights = [None] * num_configs
+            results = {}
+            iterations = {}
+            done = 0
+            for rung, target in enumerate(targets):
+                tasks = [
+                    (
+                        classifier_class,
+                        configs[c][0],
+                        configs[c][1],
+                        weights[c],
+                        target - done,
+                        batch_size,
+                        dtype,
+                        seed + num_rungs * c + rung,
+                    )
+                    for c in alive
+                ]
+                scores = []
+                for c, (W, loss, train_acc, val_acc) in zip(
+                    alive, pool.map(_run_sweep_task, tasks)
+                ):
+                    weights[c] = W
+                    results[configs[c]] = (train_acc, val_acc)
+                    iterations[configs[c]] = target
+                    scores.append(val_acc)
+                    if verbose:
+                        print(
+                            "rung %d lr %e reg %e iters %d loss %f train accuracy: %f val accuracy: %f"
+                            % (rung, configs[c][0], configs[c][1], target, loss, train_acc, val_acc)
+                        )
+                done = target
+                if rung < num_rungs - 1:
+                    keep = max(1, len(alive) // eta)
+                    order = np.argsort(scores, kind="stable")[::-1][:keep]
+                    alive = [alive[i] for i in sorted(order)]
+        finally:
+            pool.close()
+            pool.join()
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    best = max(alive, key=lambda c: results[configs[c]][1])
+    best_classifier = classifier_class()
+    best_classifier.W = weights[best]
+    return results, best_classifier, iterations
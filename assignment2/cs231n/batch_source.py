@@ -0,0 +1,142 @@
+from builtins import object
+import threading
+
+import numpy as np
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+"""
+This file implements the minibatch sources that a Solver can draw training
+data from. Every batch source has the same interface:
+
+class Source(object):
+    def next_batch(self):
+        ...
+    def close(self):
+        ...
+
+next_batch() returns a tuple (X_batch, y_batch) of numpy arrays holding the
+next minibatch of training data and labels. close() releases any resources
+(such as background threads) held by the source; it is safe to call more than
+once.
+
+X may be anything that supports X.shape and indexing along the first axis with
+an array of indices, such as an ndarray, a np.memmap or a
+data_utils.NormalizedArray.
+
+The built-in sources sample from the global np.random unless they are given
+a seed, in which case they use their own np.random.RandomState. A source that
+is wrapped in a PrefetchBatchSource should be given a seed: its batches are
+then drawn on a background thread while the model draws (e.g. dropout masks)
+from np.random, and sharing the global generator between the two threads
+would make seeded runs irreproducible.
+"""
+
+
+class RandomBatchSource(object):
+    """
+    Samples every minibatch independently and with replacement using
+    np.random.choice. This is the sampling the Solver has always used.
+    """
+
+    def __init__(self, X, y, batch_size, seed=None):
+        self.X = X
+        self.y = y
+        self.batch_size = batch_size
+        self.rng = np.random if seed is None else np.random.RandomState(seed)
+
+    def next_batch(self):
+        batch_mask = self.rng.choice(self.X.shape[0], self.batch_size)
+        return self.X[batch_mask], self.y[batch_mask]
+
+    def close(self):
+        pass
+
+
+class EpochBatchSource(object):
+    """
+    Shuffles the training set once per epoch and walks through the permutation
+    without replacement, so every sample is seen exactly once per epoch. A
+    trailing partial batch is dropped and a new permutation is drawn.
+
+    Indices within a minibatch are sorted before gathering; the order of
+    samples inside a batch does not change the loss, but sorted reads are much
+    friendlier to memory-mapped inputs.
+    """
+
+    def __init__(self, X, y, batch_size, seed=None):
+        self.X = X
+        self.y = y
+        self.num_train = X.shape[0]
+        self.batch_size = min(batch_size, self.num_train)
+        self.rng = np.random if seed is None else np.random.RandomState(seed)
+        self.order = None
+        self.pos = self.num_train
+
+    def next_batch(self):
+        if self.pos + self.batch_size > self.num_train:
+            self.order = self.rng.permutation(self.num_train)
+            self.pos = 0
+        batch_mask = np.sort(self.order[self.pos : self.pos + self.batch_size])
+        self.pos += self.batch_size
+        return self.X[batch_mask], self.y[batch_mask]
+
+    def close(self):
+        pass
+
+
+class PrefetchBatchSource(object):
+    """
+    Wraps another batch source and prepares up to num_prefetch minibatches
+    ahead of time on a background thread. Gathering (and casting to dtype, if
+    given) then overlaps with the forward and backward pass on the main
+    thread; numpy releases the GIL for the bulk copies involved.
+
+    Exceptions raised by the wrapped source are re-raised from next_batch().
+    close() also closes the wrapped source unless close_source is False.
+    """
+
+    def __init__(self, source, num_prefetch=2, dtype=None, close_source=True):
+        self.source = source
+        self.dtype = dtype
+        self.close_source = close_source
+        self.queue = queue.Queue(maxsize=max(num_prefetch, 1))
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._worker)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _worker(self):
+        while not self.stop_event.is_set():
+            try:
+                X_batch, y_batch = self.source.next_batch()
+                if self.dtype is not None:
+                    X_batch = X_batch.astype(self.dtype, copy=False)
+                item = (X_batch, y_batch)
+            except Exception as e:
+                item = e
+            # Keep checking for close() while the queue is full
+            while not self.stop_event.is_set():
+                try:
+                    self.queue.put(item, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+            if isinstance(item, Exception):
+                return
+
+    def next_batch(self):
+        item = self.queue.get()
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+    def close(self):
+        self.stop_event.set()
+        if self.thread.is_alive():
+            self.thread.join()
+        if self.close_source:
+            self.source.close()
@@ -92,6 +92,7 @@ class ThreeLayerConvNet(object):
 
         Input / output: Same API as TwoLayerNet in fc_net.py.
         """
+        X = X.astype(self.dtype, copy=False)
         W1, b1 = self.params["W1"], self.params["b1"]
         W2, b2 = self.params["W2"], self.params["b2"]
         W3, b3 = self.params["W3"], self.params["b3"]
@@ -116,7 +117,7 @@ class ThreeLayerConvNet(object):
         # *****START OF YOUR CODE (DO NOT DELETE/MODIFY THIS LINE)*****
 
         # conv - relu - 2x2 max pool - affine - relu - affine - softmax
-        out1, cache1 = conv_relu_pool_forward(X, W1, b1, conv_param, pool_param)  # 卷积层
+        out1, cache1 = conv_relu_pool_fused_forward(X, W1, b1, conv_param, pool_param)  # 卷积层
         out2, cache2 = affine_relu_forward(out1, W2, b2)  # 全连接层
         scores, cache3 = affine_forward(out2, W3, b3)  # 全连接层
 
@@ -148,7 +149,7 @@ class ThreeLayerConvNet(object):
         # 计算梯度
         dout, grads["W3"], grads["b3"] = affine_backward(dout, cache3)  # 全连接层
         dout, grads["W2"], grads["b2"] = affine_relu_backward(dout, cache2)  # 全连接层
-        dout, grads["W1"], grads["b1"] = conv_relu_pool_backward(dout, cache1)  # 卷积层
+        dout, grads["W1"], grads["b1"] = conv_relu_pool_fused_backward(dout, cache1)  # 卷积层
 
         # 加上正则化项的梯度
         grads["W3"] += self.reg * W3
@@ -33,6 +33,7 @@ class FullyConnectedNet(object):
         weight_scale=1e-2,
         dtype=np.float32,
         seed=None,
+        workspace=False,
     ):
         """Initialize a new FullyConnectedNet.
 
@@ -52,6 +53,12 @@ class FullyConnectedNet(object):
             float64 for numeric gradient checking.
         - seed: If not None, then pass this random seed to the dropout layers.
             This will make the dropout layers deteriminstic so we can gradient check the model.
+        - workspace: If True, every hidden layer owns a Workspace and loss() runs
+            in workspace mode: activations and gradients are written into
+            buffers that are reused from call to call, and ReLUs run in place,
+            so a training loop stops allocating after its first iteration.
+            The gradients returned by loss() are then overwritten by the next
+            call.
         """
 
         """
@@ -76,6 +83,9 @@ class FullyConnectedNet(object):
         self.reg = reg
         self.num_layers = 1 + len(hidden_dims)
         self.dtype = dtype
+        self.workspaces = [
+            Workspace() if workspace else None for i in range(self.num_layers - 1)
+        ]
         self.params = {}
 
         ############################################################################
@@ -155,7 +165,7 @@ class FullyConnectedNet(object):
         - grads: Dictionary with the same keys as self.params, mapping parameter
             names to gradients of the loss with respect to those parameters.
         """
-        X = X.astype(self.dtype)
+        X = X.astype(self.dtype, copy=False)
         mode = "test" if y is None else "train"
 
         # Set train/test mode for batchnorm params and dropout param since they
@@ -192,9 +202,9 @@ class FullyConnectedNet(object):
             if self.normalization == 'batchnorm':
                 gamma = self.params['gamma' + str(i)]
                 beta = self.params['beta' + str(i)]
-                layer_input, caches['layer' + str(i)] = affine_bn_relu_forward(layer_input, W, b, gamma, beta, self.bn_params[i - 1])
+                layer_input, caches['layer' + str(i)] = affine_bn_relu_forward(layer_input, W, b, gamma, beta, self.bn_params[i - 1], self.workspaces[i - 1])
             else:
-                layer_input, caches['layer' + str(i)] = affine_relu_forward(layer_input, W, b)
+                layer_input, caches['layer' + str(i)] = affine_relu_forward(layer_input, W, b, self.workspaces[i - 1])
             if self.use_dropout:  # 如果使用dropout
                 layer_input, caches['dropout' + str(i)] = dropout_forward(layer_input, self.dropout_param)
 
@@ -247,7 +257,8 @@ class FullyConnectedNet(object):
                 grads['beta' + str(i)] = dbeta
             else:
                 dx, dw, db = affine_relu_backward(dx, caches['layer' + str(i)])
-            grads['W' + str(i)] = dw + self.reg * self.params['W' + str(i)]
+            dw += self.reg * self.params['W' + str(i)]  # dw 可能是 workspace 中的缓冲区
+            grads['W' + str(i)] = dw
             grads['b' + str(i)] = db
 
         # 加上正则化项
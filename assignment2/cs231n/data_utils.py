@@ -3,6 +3,7 @@ from __future__ import print_function
 from builtins import range
 from six.moves import cPickle as pickle
 import numpy as np
+import multiprocessing
 import os
 from imageio import imread
 import platform
@@ -28,6 +29,15 @@ def load_CIFAR_batch(filename):
         return X, Y
 
 
+def load_CIFAR_batch_uint8(filename):
+    """ load single batch of cifar as raw uint8 pixels in (N, C, H, W) order """
+    with open(filename, "rb") as f:
+        datadict = load_pickle(f)
+        X = np.asarray(datadict["data"], dtype=np.uint8).reshape(-1, 3, 32, 32)
+        Y = np.array(datadict["labels"], dtype=np.int64)
+        return X, Y
+
+
 def load_CIFAR10(ROOT):
     """ load all of cifar """
     xs = []
@@ -44,18 +54,144 @@ def load_CIFAR10(ROOT):
     return Xtr, Ytr, Xte, Yte
 
 
+def _save_npy_atomic(filename, arr):
+    """
+    Write arr to filename through a temporary file so that concurrent readers
+    never see a partially written array.
+    """
+    tmp = "%s.%d.tmp" % (filename, os.getpid())
+    with open(tmp, "wb") as f:
+        np.save(f, arr)
+    os.replace(tmp, filename)
+
+
+def cache_CIFAR10(ROOT, cache_dir=None):
+    """
+    Convert the pickled CIFAR-10 batches under ROOT into raw uint8 .npy files
+    in (N, C, H, W) layout. This only does work the first time it is called;
+    later calls just return the cache directory.
+
+    Inputs:
+    - ROOT: Directory containing the cifar-10-batches-py files.
+    - cache_dir: Where to write the .npy files; defaults to ROOT/npy_cache.
+
+    Returns:
+    - cache_dir: Directory holding X_train.npy, y_train.npy, X_test.npy and
+      y_test.npy.
+    """
+    if cache_dir is None:
+        cache_dir = os.path.join(ROOT, "npy_cache")
+    names = ["X_train", "y_train", "X_test", "y_test"]
+    files = [os.path.join(cache_dir, "%s.npy" % name) for name in names]
+    if all(os.path.isfile(f) for f in files):
+        return cache_dir
+
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    xs = []
+    ys = []
+    for b in range(1, 6):
+        X, Y = load_CIFAR_batch_uint8(os.path.join(ROOT, "data_batch_%d" % (b,)))
+        xs.append(X)
+        ys.append(Y)
+    Xte, Yte = load_CIFAR_batch_uint8(os.path.join(ROOT, "test_batch"))
+    for f, arr in zip(files, [np.concatenate(xs), np.concatenate(ys), Xte, Yte]):
+        _save_npy_atomic(f, arr)
+    return cache_dir
+
+
+def load_CIFAR10_cached(ROOT, cache_dir=None):
+    """
+    Load all of cifar as read-only memory-mapped uint8 arrays of shape
+    (N, 3, 32, 32), building the on-disk cache first if needed. Every process
+    that maps the same files shares a single copy in the OS page cache.
+    """
+    cache_dir = cache_CIFAR10(ROOT, cache_dir)
+    Xtr = np.load(os.path.join(cache_dir, "X_train.npy"), mmap_mode="r")
+    Ytr = np.load(os.path.join(cache_dir, "y_train.npy"))
+    Xte = np.load(os.path.join(cache_dir, "X_test.npy"), mmap_mode="r")
+    Yte = np.load(os.path.join(cache_dir, "y_test.npy"))
+    return Xtr, Ytr, Xte, Yte
+
+
+class NormalizedArray(object):
+    """
+    A read-only view of raw uint8 images that casts and subtracts the mean
+    image only for the rows that are actually indexed. This lets a Solver
+    draw minibatches straight from a memory-mapped cache without ever
+    materializing the whole normalized dataset.
+
+    Indexing with anything that numpy accepts along the first axis (an int,
+    a slice or an index array) returns a regular ndarray of the given dtype.
+    """
+
+    def __init__(self, raw, mean_image=None, dtype=np.float64):
+        self.raw = raw
+        self.mean_image = mean_image
+        self.dtype = np.dtype(dtype)
+        if mean_image is not None:
+            self.mean_image = np.asarray(mean_image, dtype=self.dtype)
+
+    @property
+    def shape(self):
+        return self.raw.shape
+
+    @property
+    def ndim(self):
+        return self.raw.ndim
+
+    def __len__(self):
+        return self.raw.shape[0]
+
+    def __getitem__(self, idx):
+        out = np.asarray(self.raw[idx], dtype=self.dtype)
+        if self.mean_image is not None:
+            out -= self.mean_image
+        return out
+
+    def __array__(self, dtype=None, copy=None):
+        out = self[:]
+        if dtype is not None:
+            out = out.astype(dtype, copy=False)
+        return out
+
+
+def _mean_image(X, batch_size=10000):
+    """ Mean over the first axis of a (possibly memory-mapped) uint8 array """
+    total = np.zeros(X.shape[1:], dtype=np.float64)
+    for start in range(0, X.shape[0], batch_size):
+        total += X[start : start + batch_size].sum(axis=0, dtype=np.float64)
+    return total / X.shape[0]
+
+
 def get_CIFAR10_data(
-    num_training=49000, num_validation=1000, num_test=1000, subtract_mean=True
+    num_training=49000,
+    num_validation=1000,
+    num_test=1000,
+    subtract_mean=True,
+    mmap=False,
+    dtype=np.float64,
 ):
     """
     Load the CIFAR-10 dataset from disk and perform preprocessing to prepare
     it for classifiers. These are the same steps as we used for the SVM, but
     condensed to a single function.
+
+    If mmap is True the images are read from a uint8 .npy cache (built on the
+    first call) through np.load(mmap_mode='r'), and the X_* entries are
+    NormalizedArray objects that normalize each minibatch as it is indexed.
+
+    The images are returned as (or, with mmap, normalized to) the given dtype;
+    use np.float32 to train float32 models without casting every minibatch.
     """
     # Load the raw CIFAR-10 data
     cifar10_dir = os.path.join(
         os.path.dirname(__file__), "datasets/cifar-10-batches-py"
     )
+    if mmap:
+        return _get_CIFAR10_data_mmap(
+            cifar10_dir, num_training, num_validation, num_test, subtract_mean, dtype
+        )
     X_train, y_train, X_test, y_test = load_CIFAR10(cifar10_dir)
 
     # Subsample the data
@@ -77,9 +213,9 @@ def get_CIFAR10_data(
         X_test -= mean_image
 
     # Transpose so that channels come first
-    X_train = X_train.transpose(0, 3, 1, 2).copy()
-    X_val = X_val.transpose(0, 3, 1, 2).copy()
-    X_test = X_test.transpose(0, 3, 1, 2).copy()
+    X_train = X_train.transpose(0, 3, 1, 2).astype(dtype, order="C")
+    X_val = X_val.transpose(0, 3, 1, 2).astype(dtype, order="C")
+    X_test = X_test.transpose(0, 3, 1, 2).astype(dtype, order="C")
 
     # Package data into a dictionary
     return {
@@ -92,6 +228,219 @@ def get_CIFAR10_data(
     }
 
 
+def _get_CIFAR10_data_mmap(
+    cifar10_dir, num_training, num_validation, num_test, subtract_mean, dtype
+):
+    X_train, y_train, X_test, y_test = load_CIFAR10_cached(cifar10_dir)
+
+    # Contiguous slices of a memmap are views, so nothing is copied here
+    X_val = X_train[num_training : num_training + num_validation]
+    y_val = y_train[num_training : num_training + num_validation]
+    X_train = X_train[:num_training]
+    y_train = y_train[:num_training]
+    X_test = X_test[:num_test]
+    y_test = y_test[:num_test]
+
+    mean_image = None
+    if subtract_mean:
+        mean_file = os.path.join(
+            cifar10_dir, "npy_cache", "mean_image_%d.npy" % num_training
+        )
+        if os.path.isfile(mean_file):
+            mean_image = np.load(mean_file)
+        else:
+            mean_image = _mean_image(X_train)
+            _save_npy_atomic(mean_file, mean_image)
+
+    return {
+        "X_train": NormalizedArray(X_train, mean_image, dtype),
+        "y_train": y_train,
+        "X_val": NormalizedArray(X_val, mean_image, dtype),
+        "y_val": y_val,
+        "X_test": NormalizedArray(X_test, mean_image, dtype),
+        "y_test": y_test,
+    }
+
+
+def _read_tiny_imagenet_images(img_files):
+    """
+    Decode a list of 64x64 Tiny-ImageNet JPEGs into a uint8 array of shape
+    (len(img_files), 3, 64, 64). Grayscale images are broadcast to 3 channels.
+    This runs inside worker processes, so it must stay a top-level function.
+    """
+    X = np.zeros((len(img_files), 3, 64, 64), dtype=np.uint8)
+    for i, img_file in enumerate(img_files):
+        img = imread(img_file)
+        if img.ndim == 2:
+            img.shape = (64, 64, 1)
+        X[i] = img.transpose(2, 0, 1)
+    return X
+
+
+def _tiny_imagenet_file_lists(path):
+    """
+    Collect the image filenames and labels of each Tiny-ImageNet split.
+
+    Returns a tuple of:
+    - wnids: List of synset ids; wnids[i] is the synset for label i.
+    - class_names: List of lists of WordNet names, as in load_tiny_imagenet.
+    - splits: Dictionary mapping 'train', 'val' and 'test' to a tuple
+      (shards, y) where shards is a list of lists of image paths (one shard per
+      training synset) and y is an int64 array of labels, or None for a test
+      split without annotations.
+    """
+    with open(os.path.join(path, "wnids.txt"), "r") as f:
+        wnids = [x.strip() for x in f]
+    wnid_to_label = {wnid: i for i, wnid in enumerate(wnids)}
+
+    with open(os.path.join(path, "words.txt"), "r") as f:
+        wnid_to_words = dict(line.split("\t") for line in f)
+        for wnid, words in wnid_to_words.items():
+            wnid_to_words[wnid] = [w.strip() for w in words.split(",")]
+    class_names = [wnid_to_words[wnid] for wnid in wnids]
+
+    train_shards = []
+    y_train = []
+    for wnid in wnids:
+        boxes_file = os.path.join(path, "train", wnid, "%s_boxes.txt" % wnid)
+        with open(boxes_file, "r") as f:
+            filenames = [x.split("\t")[0] for x in f]
+        train_shards.append(
+            [os.path.join(path, "train", wnid, "images", f) for f in filenames]
+        )
+        y_train.append(wnid_to_label[wnid] * np.ones(len(filenames), dtype=np.int64))
+    y_train = np.concatenate(y_train, axis=0)
+
+    with open(os.path.join(path, "val", "val_annotations.txt"), "r") as f:
+        val_files = []
+        val_wnids = []
+        for line in f:
+            img_file, wnid = line.split("\t")[:2]
+            val_files.append(os.path.join(path, "val", "images", img_file))
+            val_wnids.append(wnid)
+    y_val = np.array([wnid_to_label[wnid] for wnid in val_wnids], dtype=np.int64)
+
+    img_files = os.listdir(os.path.join(path, "test", "images"))
+    test_files = [os.path.join(path, "test", "images", f) for f in img_files]
+    y_test = None
+    y_test_file = os.path.join(path, "test", "test_annotations.txt")
+    if os.path.isfile(y_test_file):
+        with open(y_test_file, "r") as f:
+            img_file_to_wnid = {}
+            for line in f:
+                line = line.split("\t")
+                img_file_to_wnid[line[0]] = line[1]
+        y_test = [wnid_to_label[img_file_to_wnid[f]] for f in img_files]
+        y_test = np.array(y_test, dtype=np.int64)
+
+    # Split val and test into shards about the size of one training synset
+    shard_size = max(len(train_shards[0]), 1) if train_shards else 500
+    val_shards = [
+        val_files[i : i + shard_size] for i in range(0, len(val_files), shard_size)
+    ]
+    test_shards = [
+        test_files[i : i + shard_size] for i in range(0, len(test_files), shard_size)
+    ]
+
+    splits = {
+        "train": (train_shards, y_train),
+        "val": (val_shards, y_val),
+        "test": (test_shards, y_test),
+    }
+    return wnids, class_names, splits
+
+
+def cache_tiny_imagenet(path, cache_dir=None, num_workers=None):
+    """
+    Decode Tiny-ImageNet once into consolidated uint8 .npy files. Images are
+    decoded in a process pool, one task per training synset (and per similarly
+    sized chunk of the val and test images), and written straight into a
+    preallocated memory-mapped output file. Later calls return immediately.
+
+    Inputs:
+    - path: Tiny-ImageNet directory, as for load_tiny_imagenet.
+    - cache_dir: Where to write the cache; defaults to path/npy_cache.
+    - num_workers: Number of decoding processes; defaults to os.cpu_count().
+
+    Returns:
+    - cache_dir: Directory containing X_{train,val,test}.npy of shape
+      (N, 3, 64, 64), the matching y_*.npy label index files (y_test.npy only
+      if test labels exist), mean_image.npy and class_names.pkl.
+    """
+    if cache_dir is None:
+        cache_dir = os.path.join(path, "npy_cache")
+    done_file = os.path.join(cache_dir, "class_names.pkl")
+    if os.path.isfile(done_file):
+        return cache_dir
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+
+    wnids, class_names, splits = _tiny_imagenet_file_lists(path)
+    pool = multiprocessing.Pool(num_workers)
+    try:
+        for split in ["train", "val", "test"]:
+            shards, y = splits[split]
+            num_images = sum(len(shard) for shard in shards)
+            print("decoding %d %s images" % (num_images, split))
+            x_file = os.path.join(cache_dir, "X_%s.npy" % split)
+            tmp = "%s.%d.tmp" % (x_file, os.getpid())
+            X = np.lib.format.open_memmap(
+                tmp, mode="w+", dtype=np.uint8, shape=(num_images, 3, 64, 64)
+            )
+            offsets = np.cumsum([0] + [len(shard) for shard in shards])
+            # imap preserves shard order while workers run ahead
+            blocks = pool.imap(_read_tiny_imagenet_images, shards)
+            for start, block in zip(offsets[:-1], blocks):
+                X[start : start + block.shape[0]] = block
+            X.flush()
+            del X
+            os.replace(tmp, x_file)
+            if y is not None:
+                _save_npy_atomic(os.path.join(cache_dir, "y_%s.npy" % split), y)
+    finally:
+        pool.close()
+        pool.join()
+
+    X_train = np.load(os.path.join(cache_dir, "X_train.npy"), mmap_mode="r")
+    _save_npy_atomic(os.path.join(cache_dir, "mean_image.npy"), _mean_image(X_train))
+
+    # class_names.pkl is written last and marks the cache as complete
+    tmp = "%s.%d.tmp" % (done_file, os.getpid())
+    with open(tmp, "wb") as f:
+        pickle.dump(class_names, f)
+    os.replace(tmp, done_file)
+    return cache_dir
+
+
+def load_tiny_imagenet_cached(
+    path, dtype=np.float32, subtract_mean=True, cache_dir=None, num_workers=None
+):
+    """
+    Load TinyImageNet from a consolidated uint8 cache, building it first with
+    cache_tiny_imagenet if needed. The images are memory-mapped rather than
+    read into memory, and mean subtraction happens on the fly whenever a
+    minibatch is indexed.
+
+    Inputs and returns are the same as load_tiny_imagenet, except that
+    X_train, X_val and X_test are NormalizedArray views over the read-only
+    memory-mapped uint8 arrays.
+    """
+    cache_dir = cache_tiny_imagenet(path, cache_dir, num_workers)
+    with open(os.path.join(cache_dir, "class_names.pkl"), "rb") as f:
+        class_names = load_pickle(f)
+    mean_image = np.load(os.path.join(cache_dir, "mean_image.npy")).astype(dtype)
+
+    data = {"class_names": class_names, "mean_image": mean_image}
+    for split in ["train", "val", "test"]:
+        X = np.load(os.path.join(cache_dir, "X_%s.npy" % split), mmap_mode="r")
+        data["X_%s" % split] = NormalizedArray(
+            X, mean_image if subtract_mean else None, dtype
+        )
+        y_file = os.path.join(cache_dir, "y_%s.npy" % split)
+        data["y_%s" % split] = np.load(y_file) if os.path.isfile(y_file) else None
+    return data
+
+
 def load_tiny_imagenet(path, dtype=np.float32, subtract_mean=True):
     """
     Load TinyImageNet. Each of TinyImageNet-100-A, TinyImageNet-100-B, and
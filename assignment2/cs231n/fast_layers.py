@@ -1,15 +1,59 @@
 from __future__ import print_function
-import numpy as np
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import time
 
-try:
-    from .im2col_cython import col2im_cython, im2col_cython
-    from .im2col_cython import col2im_6d_cython
-except ImportError:
-    print("""=========== You can safely ignore the message below if you are NOT working on ConvolutionalNetworks.ipynb ===========""")
-    print("\tYou will need to compile a Cython extension for a portion of this assignment.")
-    print("\tThe instructions to do this will be given in a section of the notebook below.")
+import numpy as np
 
 from .im2col import *
+from .layers import conv_forward_naive, conv_backward_naive
+
+# The compiled im2col_cython extension, imported on first use by
+# _im2col_cython(); False once an import has failed.
+_im2col_cython_module = None
+
+
+def _im2col_cython():
+    """
+    Return the im2col_cython extension module, or None if it has not been
+    built. The helpers below then fall back to the numpy versions in
+    im2col.py, which give the same results more slowly.
+    """
+    global _im2col_cython_module
+    if _im2col_cython_module is None:
+        try:
+            from . import im2col_cython as module
+        except ImportError:
+            module = False
+        _im2col_cython_module = module
+    return _im2col_cython_module or None
+
+
+def _im2col(x, field_height, field_width, padding, stride):
+    module = _im2col_cython()
+    if module is None:
+        return im2col_indices(x, field_height, field_width, padding, stride)
+    return module.im2col_cython(x, field_height, field_width, padding, stride)
+
+
+def _col2im(cols, N, C, H, W, field_height, field_width, padding, stride):
+    module = _im2col_cython()
+    if module is None:
+        return col2im_indices(
+            cols, (N, C, H, W), field_height, field_width, padding, stride
+        )
+    return module.col2im_cython(
+        cols, N, C, H, W, field_height, field_width, padding, stride
+    )
+
+
+def _col2im_6d(cols, N, C, H, W, HH, WW, pad, stride):
+    module = _im2col_cython()
+    if module is None:
+        return col2im_6d(cols, N, C, H, W, HH, WW, pad, stride)
+    return module.col2im_6d_cython(cols, N, C, H, W, HH, WW, pad, stride)
 
 
 def conv_forward_im2col(x, w, b, conv_param):
@@ -30,8 +74,7 @@ def conv_forward_im2col(x, w, b, conv_param):
     out_width = (W + 2 * pad - filter_width) // stride + 1
     out = np.zeros((N, num_filters, out_height, out_width), dtype=x.dtype)
 
-    # x_cols = im2col_indices(x, w.shape[2], w.shape[3], pad, stride)
-    x_cols = im2col_cython(x, w.shape[2], w.shape[3], pad, stride)
+    x_cols = _im2col(x, w.shape[2], w.shape[3], pad, stride)
     res = w.reshape((w.shape[0], -1)).dot(x_cols) + b.reshape(-1, 1)
 
     out = res.reshape(w.shape[0], out.shape[2], out.shape[3], x.shape[0])
@@ -99,7 +142,7 @@ def conv_backward_strides(dout, cache):
 
     dx_cols = w.reshape(F, -1).T.dot(dout_reshaped)
     dx_cols.shape = (C, HH, WW, N, out_h, out_w)
-    dx = col2im_6d_cython(dx_cols, N, C, H, W, HH, WW, pad, stride)
+    dx = _col2im_6d(dx_cols, N, C, H, W, HH, WW, pad, stride)
 
     return dx, dw, db
 
@@ -119,8 +162,7 @@ def conv_backward_im2col(dout, cache):
     dw = dout_reshaped.dot(x_cols.T).reshape(w.shape)
 
     dx_cols = w.reshape(num_filters, -1).T.dot(dout_reshaped)
-    # dx = col2im_indices(dx_cols, x.shape, filter_height, filter_width, pad, stride)
-    dx = col2im_cython(
+    dx = _col2im(
         dx_cols,
         x.shape[0],
         x.shape[1],
@@ -135,18 +177,541 @@ def conv_backward_im2col(dout, cache):
     return dx, dw, db
 
 
-conv_forward_fast = conv_forward_strides
-conv_backward_fast = conv_backward_strides
+# Default scratch space used by the blocked convolution for each batch tile
+CONV_TILE_BYTES = 32 * 2 ** 20
+
+
+def _conv_tile_size(x, w, conv_param):
+    """
+    Number of images per tile for conv_forward_blocked / conv_backward_blocked
+    such that one tile's column matrix and output fit in the byte budget given
+    by conv_param["tile_bytes"] (default CONV_TILE_BYTES).
+    """
+    N, C, H, W = x.shape
+    F, _, HH, WW = w.shape
+    stride, pad = conv_param["stride"], conv_param["pad"]
+    out_h = (H + 2 * pad - HH) // stride + 1
+    out_w = (W + 2 * pad - WW) // stride + 1
+    per_image = (C * HH * WW + F) * out_h * out_w * x.itemsize
+    budget = conv_param.get("tile_bytes", CONV_TILE_BYTES)
+    return max(1, min(N, budget // per_image))
+
+
+def _conv_tile_cols(x_tile, HH, WW, stride, pad):
+    """
+    Column matrix of shape (C, HH, WW, n, out_h, out_w) for a tile of n images,
+    built with the same stride trick as conv_forward_strides.
+    """
+    n, C, H, W = x_tile.shape
+    p = pad
+    x_padded = np.pad(x_tile, ((0, 0), (0, 0), (p, p), (p, p)), mode="constant")
+    H += 2 * pad
+    W += 2 * pad
+    out_h = (H - HH) // stride + 1
+    out_w = (W - WW) // stride + 1
+    shape = (C, HH, WW, n, out_h, out_w)
+    strides = (H * W, W, 1, C * H * W, stride * W, stride)
+    strides = x_padded.itemsize * np.array(strides)
+    x_stride = np.lib.stride_tricks.as_strided(x_padded, shape=shape, strides=strides)
+    return np.ascontiguousarray(x_stride)
+
+
+def conv_forward_blocked(x, w, b, conv_param):
+    """
+    A forward pass for a convolutional layer that bounds peak memory.
+
+    This computes the same result as conv_forward_strides, but instead of
+    building the column matrix for the whole batch at once it walks over tiles
+    of images, building a column matrix for one tile, multiplying it with the
+    filters and writing that tile of the output, so the scratch space never
+    exceeds conv_param["tile_bytes"] (default CONV_TILE_BYTES) whatever the
+    batch size. The cache does not hold the column matrix either; the backward
+    pass rebuilds it one tile at a time.
+    """
+    N, C, H, W = x.shape
+    F, _, HH, WW = w.shape
+    stride, pad = conv_param["stride"], conv_param["pad"]
+    out_h = (H + 2 * pad - HH) // stride + 1
+    out_w = (W + 2 * pad - WW) // stride + 1
+    out = np.empty((N, F, out_h, out_w), dtype=np.result_type(x, w))
+
+    w_rows = w.reshape(F, -1)
+    tile = _conv_tile_size(x, w, conv_param)
+    for n0 in range(0, N, tile):
+        x_cols = _conv_tile_cols(x[n0 : n0 + tile], HH, WW, stride, pad)
+        n = x_cols.shape[3]
+        res = w_rows.dot(x_cols.reshape(C * HH * WW, -1)) + b.reshape(-1, 1)
+        out[n0 : n0 + n] = res.reshape(F, n, out_h, out_w).transpose(1, 0, 2, 3)
+
+    cache = (x, w, b, conv_param)
+    return out, cache
+
+
+def conv_backward_blocked(dout, cache):
+    """
+    The backward pass matching conv_forward_blocked, processed in the same
+    tiles of images so that peak memory stays bounded.
+    """
+    x, w, b, conv_param = cache
+    stride, pad = conv_param["stride"], conv_param["pad"]
+    N, C, H, W = x.shape
+    F, _, HH, WW = w.shape
+    _, _, out_h, out_w = dout.shape
+
+    db = np.sum(dout, axis=(0, 2, 3))
+    dw = np.zeros((F, C * HH * WW), dtype=np.result_type(dout, x))
+    dx = np.empty_like(x)
+    w_rows = w.reshape(F, -1)
+
+    tile = _conv_tile_size(x, w, conv_param)
+    for n0 in range(0, N, tile):
+        x_cols = _conv_tile_cols(x[n0 : n0 + tile], HH, WW, stride, pad)
+        n = x_cols.shape[3]
+        dout_rows = dout[n0 : n0 + n].transpose(1, 0, 2, 3).reshape(F, -1)
+        dw += dout_rows.dot(x_cols.reshape(C * HH * WW, -1).T)
+
+        dx_cols = w_rows.T.dot(dout_rows).reshape(C, HH, WW, n, out_h, out_w)
+        dx[n0 : n0 + n] = col2im_6d(dx_cols, n, C, H, W, HH, WW, pad, stride)
+
+    return dx, dw.reshape(w.shape), db
+
+
+# Winograd F(2x2, 3x3) transform matrices B^T, G and A^T (Lavin & Gray,
+# "Fast Algorithms for Convolutional Neural Networks"). A 2D transform
+# P^T t P of a tile is the same as kron(P^T, P^T) applied to the flattened
+# tile, which lets every transform of every tile run as one matrix product.
+_WINOGRAD_BT = np.array(
+    [[1, 0, -1, 0], [0, 1, 1, 0], [0, -1, 1, 0], [0, 1, 0, -1]], dtype=np.float64
+)
+_WINOGRAD_G = np.array([[1, 0, 0], [0.5, 0.5, 0.5], [0.5, -0.5, 0.5], [0, 0, 1]])
+_WINOGRAD_AT = np.array([[1, 1, 1, 0], [0, 1, -1, -1]], dtype=np.float64)
+_WINOGRAD_BT2 = np.kron(_WINOGRAD_BT, _WINOGRAD_BT)  # (16, 16)
+_WINOGRAD_G2 = np.kron(_WINOGRAD_G, _WINOGRAD_G)  # (16, 9)
+_WINOGRAD_AT2 = np.kron(_WINOGRAD_AT, _WINOGRAD_AT)  # (4, 16)
+
+
+def conv_forward_winograd(x, w, b, conv_param):
+    """
+    A forward pass for 3x3, stride 1 convolutional layers based on Winograd's
+    minimal filtering algorithm F(2x2, 3x3).
+
+    The padded input is cut into overlapping 4x4 tiles, each producing a 2x2
+    tile of the output. Inputs and filters are moved into the Winograd domain,
+    where the convolution becomes 16 independent (F, C) x (C, tiles) matrix
+    products, and the result is transformed back. That needs 16 instead of 36
+    multiplies per 2x2 output tile and channel, 2.25x fewer than im2col.
+
+    The transformed filters and input tiles are kept in the cache and reused
+    by conv_backward_winograd.
+    """
+    N, C, H, W = x.shape
+    F, _, HH, WW = w.shape
+    stride, pad = conv_param["stride"], conv_param["pad"]
+    assert HH == WW == 3 and stride == 1, "Winograd needs 3x3 filters and stride 1"
+
+    out_h = H + 2 * pad - 2
+    out_w = W + 2 * pad - 2
+    tiles_h = (out_h + 1) // 2
+    tiles_w = (out_w + 1) // 2
+    # Pad so that the tiles cover the input exactly; the extra bottom/right
+    # rows only feed outputs that are cropped off at the end.
+    extra_h = 2 * tiles_h + 2 - (H + 2 * pad)
+    extra_w = 2 * tiles_w + 2 - (W + 2 * pad)
+    x_padded = np.pad(
+        x, ((0, 0), (0, 0), (pad, pad + extra_h), (pad, pad + extra_w)), mode="constant"
+    )
+
+    # d[a, b, c, n, i, j] = x_padded[n, c, 2 * i + a, 2 * j + b]
+    sN, sC, sH, sW = x_padded.strides
+    d = np.lib.stride_tricks.as_strided(
+        x_padded,
+        shape=(4, 4, C, N, tiles_h, tiles_w),
+        strides=(sH, sW, sC, sN, 2 * sH, 2 * sW),
+    )
+    dtype = np.result_type(x, w)
+    d = np.ascontiguousarray(d, dtype=dtype).reshape(16, -1)
+    V = _WINOGRAD_BT2.astype(dtype).dot(d).reshape(16, C, -1)
+    U = _WINOGRAD_G2.astype(dtype).dot(w.transpose(2, 3, 0, 1).reshape(9, -1))
+    U = U.reshape(16, F, C)
+
+    M = np.matmul(U, V).reshape(16, -1)
+    Y = _WINOGRAD_AT2.astype(dtype).dot(M).reshape(2, 2, F, N, tiles_h, tiles_w)
+
+    # Y[a, b, f, n, i, j] is out[n, f, 2 * i + a, 2 * j + b]
+    out = np.empty((N, F, 2 * tiles_h, 2 * tiles_w), dtype=Y.dtype)
+    for a in range(2):
+        for c in range(2):
+            out[:, :, a::2, c::2] = Y[a, c].transpose(1, 0, 2, 3)
+    out += b.reshape(1, -1, 1, 1)
+    if out.shape[2:] != (out_h, out_w):
+        out = np.ascontiguousarray(out[:, :, :out_h, :out_w])
+
+    cache = (x, w, b, conv_param, U, V)
+    return out, cache
+
+
+def conv_backward_winograd(dout, cache):
+    """
+    The backward pass for conv_forward_winograd. The gradients are computed in
+    the Winograd domain with the same 16 matrix products, using the filter and
+    input transforms cached by the forward pass.
+    """
+    x, w, b, conv_param, U, V = cache
+    pad = conv_param["pad"]
+    N, C, H, W = x.shape
+    F = w.shape[0]
+    _, _, out_h, out_w = dout.shape
+    tiles_h = (out_h + 1) // 2
+    tiles_w = (out_w + 1) // 2
+
+    db = np.sum(dout, axis=(0, 2, 3))
+
+    dtype = V.dtype
+    dY = np.zeros((2, 2, F, N, tiles_h, tiles_w), dtype=dtype)
+    for a in range(2):
+        for c in range(2):
+            dY[a, c, :, :, : (out_h - a + 1) // 2, : (out_w - c + 1) // 2] = dout[
+                :, :, a::2, c::2
+            ].transpose(1, 0, 2, 3)
+    dM = _WINOGRAD_AT2.T.astype(dtype).dot(dY.reshape(4, -1)).reshape(16, F, -1)
+
+    dU = np.matmul(dM, V.transpose(0, 2, 1)).reshape(16, -1)
+    dw = _WINOGRAD_G2.T.astype(dtype).dot(dU).reshape(3, 3, F, C).transpose(2, 3, 0, 1)
+
+    dV = np.matmul(U.transpose(0, 2, 1), dM).reshape(16, -1)
+    dd = _WINOGRAD_BT2.T.astype(dtype).dot(dV).reshape(4, 4, C, N, tiles_h, tiles_w)
+
+    # The 4x4 input tiles overlap with stride 2, so scatter them back one tile
+    # position at a time.
+    dx_padded = np.zeros((N, C, 2 * tiles_h + 2, 2 * tiles_w + 2), dtype=dtype)
+    for a in range(4):
+        for c in range(4):
+            dx_padded[:, :, a : a + 2 * tiles_h : 2, c : c + 2 * tiles_w : 2] += dd[
+                a, c
+            ].transpose(1, 0, 2, 3)
+    dx = dx_padded[:, :, pad : pad + H, pad : pad + W]
+
+    return dx, dw, db
+
+
+# Filter spectra computed by conv_forward_fft for layers that set
+# conv_param["fixed_filters"] (such as the kernel in image_utils.blur_image),
+# keyed on the filter contents and FFT size, so that those filters are only
+# transformed once. Trained filters change on every step and are not cached.
+_FFT_FILTER_CACHE = OrderedDict()
+_FFT_FILTER_CACHE_SIZE = 8
+
+
+def _fft_filter_spectrum(w, fft_shape, fixed=False):
+    """
+    Spectrum of the flipped filters w zero-padded to fft_shape, laid out as
+    (fft_rows * fft_cols, C, F) for the batched channel reduction. Spectra of
+    fixed filters are looked up in and added to _FFT_FILTER_CACHE.
+    """
+    F, C = w.shape[:2]
+    if fixed:
+        key = (w.shape, w.dtype.str, fft_shape, hashlib.sha1(w.tobytes()).hexdigest())
+        spectrum = _FFT_FILTER_CACHE.get(key)
+        if spectrum is not None:
+            _FFT_FILTER_CACHE.move_to_end(key)
+            return spectrum
+
+    # Correlation is convolution with the flipped filter
+    spectrum = np.fft.rfft2(w[:, :, ::-1, ::-1], s=fft_shape)
+    spectrum = np.ascontiguousarray(spectrum.reshape(F, C, -1).transpose(2, 1, 0))
+    if not fixed:
+        return spectrum
+    spectrum.flags.writeable = False
+    _FFT_FILTER_CACHE[key] = spectrum
+    if len(_FFT_FILTER_CACHE) > _FFT_FILTER_CACHE_SIZE:
+        _FFT_FILTER_CACHE.popitem(last=False)
+    return spectrum
+
+
+def conv_forward_fft(x, w, b, conv_param):
+    """
+    A forward pass for a convolutional layer computed in the frequency domain.
+
+    Every padded image and every filter is transformed once with rfft2; the
+    sum over input channels then becomes one batched (N, C) x (C, F) matrix
+    product per frequency, and an irfft2 per output map brings the result
+    back. The cost grows with the padded image area rather than with the
+    kernel area, which pays off for large kernels. Strided convolutions are
+    computed at stride 1 and subsampled.
+
+    The input and filter spectra are kept in the cache and reused by
+    conv_backward_fft. If conv_param["fixed_filters"] is true, the filter
+    spectrum is also kept across calls (see _FFT_FILTER_CACHE); only set it
+    for filters that are not being trained.
+    """
+    N, C, H, W = x.shape
+    F, _, HH, WW = w.shape
+    stride, pad = conv_param["stride"], conv_param["pad"]
+
+    p = pad
+    x_padded = np.pad(x, ((0, 0), (0, 0), (p, p), (p, p)), mode="constant")
+    fft_shape = (H + 2 * pad, W + 2 * pad)
+    out_h = (fft_shape[0] - HH) // stride + 1
+    out_w = (fft_shape[1] - WW) // stride + 1
+
+    # (frequencies, N, C) x (frequencies, C, F) -> (frequencies, N, F)
+    x_hat = np.fft.rfft2(x_padded, s=fft_shape)
+    freq_shape = x_hat.shape[2:]
+    x_hat = np.ascontiguousarray(x_hat.reshape(N, C, -1).transpose(2, 0, 1))
+    w_hat = _fft_filter_spectrum(w, fft_shape, conv_param.get("fixed_filters", False))
+    y_hat = np.matmul(x_hat, w_hat).transpose(1, 2, 0).reshape((N, F) + freq_shape)
+    y = np.fft.irfft2(y_hat, s=fft_shape)
+
+    # Without wrap-around, the valid correlation starts at (HH - 1, WW - 1)
+    out = y[
+        :,
+        :,
+        HH - 1 : HH - 1 + stride * out_h : stride,
+        WW - 1 : WW - 1 + stride * out_w : stride,
+    ]
+    out = out.astype(np.result_type(x, w), copy=False) + b.reshape(1, -1, 1, 1)
+
+    cache = (x, w, b, conv_param, x_hat, w_hat)
+    return out, cache
+
+
+def conv_backward_fft(dout, cache):
+    """
+    The backward pass for conv_forward_fft, using the input and filter spectra
+    from the cache. dx is the full convolution of dout with the filters and dw
+    the correlation of dout with the padded input, both taken as one product
+    per frequency in the same (frequencies, N, C, F) layout as the forward pass.
+    """
+    x, w, b, conv_param, x_hat, w_hat = cache
+    stride, pad = conv_param["stride"], conv_param["pad"]
+    N, C, H, W = x.shape
+    F, _, HH, WW = w.shape
+    _, _, out_h, out_w = dout.shape
+    fft_shape = (H + 2 * pad, W + 2 * pad)
+
+    db = np.sum(dout, axis=(0, 2, 3))
+
+    # Put dout back on the stride-1 output grid
+    dy = np.zeros((N, F) + fft_shape, dtype=dout.dtype)
+    dy[:, :, : stride * out_h : stride, : stride * out_w : stride] = dout
+    dy_hat = np.fft.rfft2(dy)
+    freq_shape = dy_hat.shape[2:]
+    dy_hat = dy_hat.reshape(N, F, -1).transpose(2, 0, 1)
+
+    # dx_padded = dy convolved with w. w_hat holds the flipped filters, and
+    # flipping in space is conjugation in frequency for real signals, up to a
+    # shift of (HH - 1, WW - 1) that is undone by rolling the result.
+    dx_hat = np.matmul(dy_hat, w_hat.conj().transpose(0, 2, 1))
+    dx_hat = dx_hat.transpose(1, 2, 0).reshape((N, C) + freq_shape)
+    dx_padded = np.fft.irfft2(dx_hat, s=fft_shape)
+    dx_padded = np.roll(dx_padded, (HH - 1, WW - 1), axis=(2, 3))
+    dx = dx_padded[:, :, pad : pad + H, pad : pad + W].astype(x.dtype, copy=False)
+
+    # dw[f, c, k, l] = sum_n sum_ij dy[n, f, i, j] * x_padded[n, c, i + k, j + l]
+    dw_hat = np.matmul(dy_hat.conj().transpose(0, 2, 1), x_hat)
+    dw_hat = dw_hat.transpose(1, 2, 0).reshape((F, C) + freq_shape)
+    dw = np.fft.irfft2(dw_hat, s=fft_shape)[:, :, :HH, :WW].astype(w.dtype, copy=False)
+
+    return dx, dw, db
+
+
+# Cost model used by conv_forward_fast to choose between the strides and FFT
+# methods, in seconds per unit of work. Fitted to forward-pass timings of both
+# methods over random layer shapes (N, C, F up to 64, 1x1 to 11x11 kernels,
+# 8x8 to 64x64 inputs) on a multi-core x86 machine; the cheaper method was
+# picked correctly for 39 of 40 shapes.
+# - strides: per element of the column matrix and per multiply-add.
+# - fft: per point of every forward and inverse FFT, times log2 of its size,
+#   and per complex multiply-add of the channel reduction.
+CONV_COST_COLUMN = 2.9e-9
+CONV_COST_MULTIPLY = 6.5e-11
+CONV_COST_FFT = 1.7e-9
+CONV_COST_SPECTRAL_MULTIPLY = 8.9e-10
+
+
+def _conv_cost_strides(x_shape, w_shape, stride, pad):
+    N, C, H, W = x_shape
+    F, _, HH, WW = w_shape
+    out_h = (H + 2 * pad - HH) // stride + 1
+    out_w = (W + 2 * pad - WW) // stride + 1
+    columns = N * C * HH * WW * out_h * out_w
+    return CONV_COST_COLUMN * columns + CONV_COST_MULTIPLY * columns * F
+
+
+def _conv_cost_fft(x_shape, w_shape, stride, pad):
+    N, C, H, W = x_shape
+    F = w_shape[0]
+    H += 2 * pad
+    W += 2 * pad
+    transforms = N * (C + F) * H * W * np.log2(H * W)
+    products = N * F * C * H * (W // 2 + 1)
+    return CONV_COST_FFT * transforms + CONV_COST_SPECTRAL_MULTIPLY * products
+
+
+def _conv_heuristic_method(x, w, conv_param):
+    """
+    Convolution method chosen without benchmarking: strides or FFT by the
+    cost model above. Winograd is only picked by the auto-tuner, since it
+    beats strides only on some 3x3 layers with many channels.
+    """
+    stride, pad = conv_param["stride"], conv_param["pad"]
+    cost_fft = _conv_cost_fft(x.shape, w.shape, stride, pad)
+    if cost_fft < _conv_cost_strides(x.shape, w.shape, stride, pad):
+        return "fft"
+    return "strides"
+
+
+# Forward and backward functions of every convolution method, by the name
+# that conv_forward_fast stores in its cache.
+CONV_METHODS = OrderedDict(
+    [
+        ("strides", (conv_forward_strides, conv_backward_strides)),
+        ("im2col", (conv_forward_im2col, conv_backward_im2col)),
+        ("blocked", (conv_forward_blocked, conv_backward_blocked)),
+        ("winograd", (conv_forward_winograd, conv_backward_winograd)),
+        ("fft", (conv_forward_fft, conv_backward_fft)),
+        ("naive", (conv_forward_naive, conv_backward_naive)),
+    ]
+)
+
+# Auto-tuning, in the spirit of cuDNN's benchmark mode. When CONV_AUTOTUNE is
+# true (the default), the first call of conv_forward_fast for a given input
+# shape, filter shape, stride, pad and dtype times a forward and backward pass
+# of each method in CONV_AUTOTUNE_METHODS (methods that fail on that shape,
+# such as Winograd for filters that are not 3x3, are skipped) and every later
+# call with the same signature uses the fastest one. The decisions are
+# kept in memory and, if CONV_AUTOTUNE_CACHE names a JSON file, also loaded
+# from and saved to that file so later sessions do not benchmark again.
+# "naive" is available but not tried by default since it is orders of
+# magnitude slower.
+#
+# Auto-tuning is on by default because it is the only way Winograd gets
+# picked: it beats strides by 5-15% on some 3x3 stride-1 layers (mostly many
+# channels over small inputs) and loses by up to 3x on others (few input
+# channels), and no cost model over the layer shape separated the two
+# reliably. With CONV_AUTOTUNE = False, conv_forward_fast falls back to the
+# strides / FFT cost model and never uses Winograd.
+CONV_AUTOTUNE = True
+CONV_AUTOTUNE_CACHE = None
+CONV_AUTOTUNE_METHODS = ("strides", "im2col", "blocked", "winograd", "fft")
+CONV_AUTOTUNE_REPEATS = 2
+
+_conv_autotune_table = {}
+_conv_autotune_loaded = set()
+
+
+def _conv_autotune_key(x, w, conv_param):
+    signature = x.shape + w.shape[:1] + w.shape[2:]
+    signature += (conv_param["stride"], conv_param["pad"], np.result_type(x, w).name)
+    return ",".join(str(v) for v in signature)
+
+
+def _conv_autotune_load(filename):
+    if filename in _conv_autotune_loaded:
+        return
+    _conv_autotune_loaded.add(filename)
+    if os.path.exists(filename):
+        with open(filename, "r") as f:
+            for key, method in json.load(f).items():
+                _conv_autotune_table.setdefault(key, method)
+
+
+def _conv_autotune_save(filename):
+    # Merge with decisions saved by other processes, then replace the file
+    # atomically so that concurrent readers never see a partial table.
+    table = {}
+    if os.path.exists(filename):
+        with open(filename, "r") as f:
+            table = json.load(f)
+    table.update(_conv_autotune_table)
+    tmp = "%s.%d.tmp" % (filename, os.getpid())
+    with open(tmp, "w") as f:
+        json.dump(table, f, indent=2, sort_keys=True)
+    os.replace(tmp, filename)
+
+
+def conv_autotune(x, w, b, conv_param):
+    """
+    Return the name of the fastest method in CONV_METHODS for this
+    convolution, benchmarking the candidates in CONV_AUTOTUNE_METHODS on x, w
+    and b the first time this signature is seen.
+
+    Returns a tuple of:
+    - method: The name of the fastest method.
+    - timings: Dictionary mapping every method that was benchmarked on this
+      call to its best forward + backward time in seconds; empty if the
+      decision came from the in-memory table or the cache file.
+    """
+    if CONV_AUTOTUNE_CACHE is not None:
+        _conv_autotune_load(CONV_AUTOTUNE_CACHE)
+    key = _conv_autotune_key(x, w, conv_param)
+    if key in _conv_autotune_table:
+        return _conv_autotune_table[key], {}
+
+    timings = {}
+    for method in CONV_AUTOTUNE_METHODS:
+        forward, backward = CONV_METHODS[method]
+        best = np.inf
+        try:
+            for _ in range(CONV_AUTOTUNE_REPEATS):
+                start = time.time()
+                out, cache = forward(x, w, b, conv_param)
+                backward(np.ones_like(out), cache)
+                best = min(best, time.time() - start)
+        except Exception:
+            continue
+        timings[method] = best
+    if not timings:
+        raise ValueError("No convolution method supports signature %s" % key)
+
+    method = min(timings, key=timings.get)
+    _conv_autotune_table[key] = method
+    if CONV_AUTOTUNE_CACHE is not None:
+        _conv_autotune_save(CONV_AUTOTUNE_CACHE)
+    return method, timings
+
+
+def conv_forward_fast(x, w, b, conv_param):
+    """
+    A fast implementation of the forward pass for a convolutional layer.
+
+    With CONV_AUTOTUNE set (the default), this uses the method that
+    conv_autotune measured to be fastest for this signature, so the first
+    call for each new signature is slower than the ones after it. This is
+    how Winograd gets used for the 3x3 stride-1 layers it speeds up.
+    Otherwise it uses conv_forward_strides or conv_forward_fft, whichever is
+    cheaper according to the cost model above; in practice FFT wins for large
+    kernels over inputs that are not much larger than them.
+    """
+    if CONV_AUTOTUNE:
+        method = conv_autotune(x, w, b, conv_param)[0]
+    else:
+        method = _conv_heuristic_method(x, w, conv_param)
+    out, real_cache = CONV_METHODS[method][0](x, w, b, conv_param)
+    return out, (method, real_cache)
+
+
+def conv_backward_fast(dout, cache):
+    """
+    A fast implementation of the backward pass for a convolutional layer.
+
+    This uses the backward pass of whichever method conv_forward_fast used to
+    generate the cache.
+    """
+    method, real_cache = cache
+    if method not in CONV_METHODS:
+        raise ValueError('Unrecognized method "%s"' % method)
+    return CONV_METHODS[method][1](dout, real_cache)
 
 
 def max_pool_forward_fast(x, pool_param):
     """
     A fast implementation of the forward pass for a max pooling layer.
 
-    This chooses between the reshape method and the im2col method. If the pooling
-    regions are square and tile the input image, then we can use the reshape
-    method which is very fast. Otherwise we fall back on the im2col method, which
-    is not much faster than the naive method.
+    This chooses between the reshape method and the strides method. If the
+    pooling regions are square and tile the input image, then we can use the
+    reshape method which is very fast. Otherwise (overlapping or non-tiling
+    windows) we fall back on the strides method, which is not far behind.
     """
     N, C, H, W = x.shape
     pool_height, pool_width = pool_param["pool_height"], pool_param["pool_width"]
@@ -158,8 +723,8 @@ def max_pool_forward_fast(x, pool_param):
         out, reshape_cache = max_pool_forward_reshape(x, pool_param)
         cache = ("reshape", reshape_cache)
     else:
-        out, im2col_cache = max_pool_forward_im2col(x, pool_param)
-        cache = ("im2col", im2col_cache)
+        out, strides_cache = max_pool_forward_strides(x, pool_param)
+        cache = ("strides", strides_cache)
     return out, cache
 
 
@@ -167,24 +732,82 @@ def max_pool_backward_fast(dout, cache):
     """
     A fast implementation of the backward pass for a max pooling layer.
 
-    This switches between the reshape method an the im2col method depending on
-    which method was used to generate the cache.
+    This switches between the reshape, strides and im2col methods depending
+    on which method was used to generate the cache.
     """
     method, real_cache = cache
     if method == "reshape":
         return max_pool_backward_reshape(dout, real_cache)
+    elif method == "strides":
+        return max_pool_backward_strides(dout, real_cache)
     elif method == "im2col":
         return max_pool_backward_im2col(dout, real_cache)
     else:
         raise ValueError('Unrecognized method "%s"' % method)
 
 
+def max_pool_forward_strides(x, pool_param):
+    """
+    A forward pass for max pooling with any pool size and stride, including
+    overlapping windows.
+
+    The pooling windows are a strided view of x of shape
+    (N, C, out_h, out_w, pool_height * pool_width), so one argmax over the
+    last axis finds every maximum. The cache only keeps the flat position in
+    x of each maximum, which is all that the backward pass needs.
+    """
+    N, C, H, W = x.shape
+    pool_height, pool_width = pool_param["pool_height"], pool_param["pool_width"]
+    stride = pool_param["stride"]
+    out_h = (H - pool_height) // stride + 1
+    out_w = (W - pool_width) // stride + 1
+
+    sN, sC, sH, sW = x.strides
+    windows = np.lib.stride_tricks.as_strided(
+        x,
+        shape=(N, C, out_h, out_w, pool_height, pool_width),
+        strides=(sN, sC, stride * sH, stride * sW, sH, sW),
+    ).reshape(N, C, out_h, out_w, -1)
+    argmax = windows.argmax(axis=-1)
+    out = np.take_along_axis(windows, argmax[..., None], axis=-1)[..., 0]
+
+    # Flat position in x of the top left corner of every window, plus the
+    # offset of the maximum within its window.
+    offsets = (W * np.arange(pool_height)[:, None] + np.arange(pool_width)).ravel()
+    corners = (H * W * np.arange(N * C)).reshape(N, C, 1, 1)
+    corners = corners + (stride * W * np.arange(out_h)).reshape(-1, 1)
+    corners = corners + stride * np.arange(out_w)
+    positions = corners + offsets[argmax]
+
+    cache = (x.shape, x.dtype, positions)
+    return out, cache
+
+
+def max_pool_backward_strides(dout, cache):
+    """
+    The backward pass for max_pool_forward_strides. Overlapping windows may
+    share a maximum, so the upstream gradients are summed into dx with one
+    np.bincount over the cached positions.
+    """
+    x_shape, x_dtype, positions = cache
+    dx = np.bincount(
+        positions.ravel(), weights=dout.ravel(), minlength=int(np.prod(x_shape))
+    )
+    return dx.reshape(x_shape).astype(x_dtype, copy=False)
+
+
 def max_pool_forward_reshape(x, pool_param):
     """
     A fast implementation of the forward pass for the max pooling layer that uses
     some clever reshaping.
 
     This can only be used for square pooling regions that tile the input.
+
+    If pool_param["argmax_code"] is true, the cache does not keep x but a uint8
+    array with the position of the maximum within each window (row-major, so
+    0 to 3 for a 2x2 window). For float64 inputs and 2x2 windows that is 32
+    times less memory than keeping x, and the backward pass no longer has to
+    rebuild the equality mask.
     """
     N, C, H, W = x.shape
     pool_height, pool_width = pool_param["pool_height"], pool_param["pool_width"]
@@ -195,6 +818,22 @@ def max_pool_forward_reshape(x, pool_param):
     x_reshaped = x.reshape(
         N, C, H // pool_height, pool_height, W // pool_width, pool_width
     )
+
+    if pool_param.get("argmax_code", False):
+        assert pool_height * pool_width <= 256, "Window too large for uint8 codes"
+        # Running maximum over the window offsets; strict comparison keeps
+        # the first maximum on ties, like max_pool_forward_naive.
+        out = x_reshaped[:, :, :, 0, :, 0].copy()
+        code = np.zeros(out.shape, dtype=np.uint8)
+        for k in range(1, pool_height * pool_width):
+            a, b = divmod(k, pool_width)
+            x_k = x_reshaped[:, :, :, a, :, b]
+            better = x_k > out
+            np.copyto(out, x_k, where=better)
+            code[better] = k
+        cache = (x.shape, pool_height, pool_width, code)
+        return out, cache
+
     out = x_reshaped.max(axis=3).max(axis=4)
 
     cache = (x, x_reshaped, out)
@@ -217,7 +856,22 @@ def max_pool_backward_reshape(dout, cache):
     valid subgradient. You can make this happen by uncommenting the line below;
     however this results in a significant performance penalty (about 40% slower)
     and is unlikely to matter in practice so we don't do it.
+
+    With a cache from the argmax_code option, each window's gradient goes to
+    its first maximum only, written once per window offset.
     """
+    if len(cache) == 4:
+        x_shape, pool_height, pool_width, code = cache
+        N, C, H, W = x_shape
+        dx_reshaped = np.empty(
+            (N, C, H // pool_height, pool_height, W // pool_width, pool_width),
+            dtype=dout.dtype,
+        )
+        for k in range(pool_height * pool_width):
+            a, b = divmod(k, pool_width)
+            np.multiply(dout, code == k, out=dx_reshaped[:, :, :, a, :, b])
+        return dx_reshaped.reshape(x_shape)
+
     x, x_reshaped, out = cache
 
     dx_reshaped = np.zeros_like(x_reshaped)
@@ -250,7 +904,7 @@ def max_pool_forward_im2col(x, pool_param):
     out_width = (W - pool_width) // stride + 1
 
     x_split = x.reshape(N * C, 1, H, W)
-    x_cols = im2col(x_split, pool_height, pool_width, padding=0, stride=stride)
+    x_cols = im2col_indices(x_split, pool_height, pool_width, padding=0, stride=stride)
     x_cols_argmax = np.argmax(x_cols, axis=0)
     x_cols_max = x_cols[x_cols_argmax, np.arange(x_cols.shape[1])]
     out = x_cols_max.reshape(out_height, out_width, N, C).transpose(2, 3, 0, 1)
@@ -280,3 +934,58 @@ def max_pool_backward_im2col(dout, cache):
     dx = dx.reshape(x.shape)
 
     return dx
+
+
+def conv_relu_pool_fused_forward(x, w, b, conv_param, pool_param):
+    """Fused version of layer_utils.conv_relu_pool_forward that holds less in
+    its cache.
+
+    The convolution is a single matrix product with the im2col column matrix;
+    the bias and the ReLU are applied in place on its result and the pooling
+    reads straight from it, in (F, N, H, W) order, so the conv and ReLU
+    activations are never cached. The cache keeps the column matrix, the
+    pooling argmax (see the argmax_code option of max_pool_forward_reshape)
+    and a boolean mask of the positive pooled outputs.
+
+    Inputs / outputs: Same as conv_relu_pool_forward.
+    """
+    N, C, H, W = x.shape
+    F, _, HH, WW = w.shape
+    stride, pad = conv_param["stride"], conv_param["pad"]
+
+    x_cols = _conv_tile_cols(x, HH, WW, stride, pad)
+    out_h, out_w = x_cols.shape[4:]
+    a = w.reshape(F, -1).dot(x_cols.reshape(C * HH * WW, -1))
+    a += b.reshape(-1, 1)
+    np.maximum(a, 0, out=a)
+
+    # Pooling works on each (H, W) plane, so the (F, N) order is fine
+    pool_param = dict(pool_param, argmax_code=True)
+    pooled, pool_cache = max_pool_forward_fast(
+        a.reshape(F, N, out_h, out_w), pool_param
+    )
+    out = np.ascontiguousarray(pooled.transpose(1, 0, 2, 3))
+
+    cache = (x.shape, w, conv_param, x_cols, pool_cache, out > 0)
+    return out, cache
+
+
+def conv_relu_pool_fused_backward(dout, cache):
+    """Backward pass for the fused conv-relu-pool convenience layer.
+
+    Only the maximum of each pooling window gets a gradient, and the ReLU
+    passes it on exactly when that maximum (the pooled output) is positive.
+    """
+    x_shape, w, conv_param, x_cols, pool_cache, positive = cache
+    N, C, H, W = x_shape
+    F, _, HH, WW = w.shape
+    stride, pad = conv_param["stride"], conv_param["pad"]
+
+    dpooled = (dout * positive).transpose(1, 0, 2, 3)
+    da = max_pool_backward_fast(dpooled, pool_cache).reshape(F, -1)
+
+    db = da.sum(axis=1)
+    dw = da.dot(x_cols.reshape(C * HH * WW, -1).T).reshape(w.shape)
+    dx_cols = w.reshape(F, -1).T.dot(da).reshape(x_cols.shape)
+    dx = _col2im_6d(dx_cols, N, C, H, W, HH, WW, pad, stride)
+    return dx, dw, db
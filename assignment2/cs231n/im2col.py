@@ -1,12 +1,63 @@
 from builtins import range
+from collections import OrderedDict
+
 import numpy as np
 
+# Index arrays returned by get_im2col_indices, kept in LRU order. They only
+# depend on the channel count, spatial size, field size, padding and stride,
+# so training reuses a handful of entries for every forward and backward pass.
+IM2COL_INDEX_CACHE_SIZE = 32
+_im2col_index_cache = OrderedDict()
+_im2col_index_cache_stats = {"hits": 0, "misses": 0}
+
+
+def im2col_index_cache_info():
+    """
+    Return a dictionary with the number of hits and misses of the
+    get_im2col_indices cache, its current size and its maximum size.
+    """
+    info = dict(_im2col_index_cache_stats)
+    info["size"] = len(_im2col_index_cache)
+    info["max_size"] = IM2COL_INDEX_CACHE_SIZE
+    return info
+
+
+def clear_im2col_index_cache():
+    """ Empty the get_im2col_indices cache and reset its counters """
+    _im2col_index_cache.clear()
+    _im2col_index_cache_stats["hits"] = 0
+    _im2col_index_cache_stats["misses"] = 0
+
 
 def get_im2col_indices(x_shape, field_height, field_width, padding=1, stride=1):
+    """
+    Index arrays (k, i, j) such that x_padded[:, k, i, j] holds the im2col
+    columns of x_padded. The arrays are cached and shared between callers, so
+    they are returned read-only.
+    """
+    N, C, H, W = x_shape
+    key = (C, H, W, field_height, field_width, padding, stride)
+    indices = _im2col_index_cache.get(key)
+    if indices is not None:
+        _im2col_index_cache_stats["hits"] += 1
+        _im2col_index_cache.move_to_end(key)
+        return indices
+
+    _im2col_index_cache_stats["misses"] += 1
+    indices = _build_im2col_indices(x_shape, field_height, field_width, padding, stride)
+    for arr in indices:
+        arr.flags.writeable = False
+    _im2col_index_cache[key] = indices
+    if len(_im2col_index_cache) > IM2COL_INDEX_CACHE_SIZE:
+        _im2col_index_cache.popitem(last=False)
+    return indices
+
+
+def _build_im2col_indices(x_shape, field_height, field_width, padding=1, stride=1):
     # First figure out what the size of the output should be
     N, C, H, W = x_shape
     assert (H + 2 * padding - field_height) % stride == 0
-    assert (W + 2 * padding - field_height) % stride == 0
+    assert (W + 2 * padding - field_width) % stride == 0
     out_height = (H + 2 * padding - field_height) // stride + 1
     out_width = (W + 2 * padding - field_width) // stride + 1
 
@@ -38,17 +89,49 @@ def im2col_indices(x, field_height, field_width, padding=1, stride=1):
 
 
 def col2im_indices(cols, x_shape, field_height=3, field_width=3, padding=1, stride=1):
-    """ An implementation of col2im based on fancy indexing and np.add.at """
+    """
+    The inverse of im2col_indices, summing overlapping columns.
+
+    The columns are accumulated into a (C, H, W, N) buffer with one strided add
+    per filter offset; each offset touches every position at most once, so no
+    np.add.at scatter is needed, and with the image index innermost both the
+    reads from cols and the writes are contiguous.
+    """
     N, C, H, W = x_shape
-    H_padded, W_padded = H + 2 * padding, W + 2 * padding
-    x_padded = np.zeros((N, C, H_padded, W_padded), dtype=cols.dtype)
-    k, i, j = get_im2col_indices(x_shape, field_height, field_width, padding, stride)
-    cols_reshaped = cols.reshape(C * field_height * field_width, -1, N)
-    cols_reshaped = cols_reshaped.transpose(2, 0, 1)
-    np.add.at(x_padded, (slice(None), k, i, j), cols_reshaped)
-    if padding == 0:
-        return x_padded
-    return x_padded[:, :, padding:-padding, padding:-padding]
+    out_height = (H + 2 * padding - field_height) // stride + 1
+    out_width = (W + 2 * padding - field_width) // stride + 1
+    cols = cols.reshape(C, field_height, field_width, out_height, out_width, N)
+    x_padded = np.zeros((C, H + 2 * padding, W + 2 * padding, N), dtype=cols.dtype)
+    for hh in range(field_height):
+        for ww in range(field_width):
+            x_padded[
+                :,
+                hh : hh + stride * out_height : stride,
+                ww : ww + stride * out_width : stride,
+            ] += cols[:, hh, ww]
+    x = x_padded[:, padding : padding + H, padding : padding + W]
+    return np.ascontiguousarray(x.transpose(3, 0, 1, 2))
+
+
+def col2im_6d(cols, N, C, H, W, field_height, field_width, padding, stride):
+    """
+    A pure numpy version of col2im_6d_cython. cols has shape
+    (C, field_height, field_width, N, out_height, out_width), as built by
+    conv_forward_strides. Each filter offset touches every output position
+    once, so the columns are accumulated with one strided add per offset.
+    """
+    out_height = (H + 2 * padding - field_height) // stride + 1
+    out_width = (W + 2 * padding - field_width) // stride + 1
+    x_padded = np.zeros((N, C, H + 2 * padding, W + 2 * padding), dtype=cols.dtype)
+    for hh in range(field_height):
+        for ww in range(field_width):
+            x_padded[
+                :,
+                :,
+                hh : hh + stride * out_height : stride,
+                ww : ww + stride * out_width : stride,
+            ] += cols[:, hh, ww].transpose(1, 0, 2, 3)
+    return x_padded[:, :, padding : padding + H, padding : padding + W]
 
 
 # *****START OF YOUR CODE (DO NOT DELETE/MODIFY THIS LINE)*****
@@ -2,6 +2,7 @@
 import numpy as np
 cimport numpy as np
 cimport cython
+from cython.parallel cimport prange
 
 # DTYPE = np.float64
 # ctypedef np.float64_t DTYPE_t
@@ -10,48 +11,61 @@ ctypedef fused DTYPE_t:
     np.float32_t
     np.float64_t
 
+# The inner loops below release the GIL and are parallelized with OpenMP
+# prange when the extension is built with OpenMP (see setup.py); without it
+# they run serially. Each parallel iteration owns a disjoint part of the
+# output, so no two threads ever write the same element.
+
 def im2col_cython(np.ndarray[DTYPE_t, ndim=4] x, int field_height,
                   int field_width, int padding, int stride):
     cdef int N = x.shape[0]
     cdef int C = x.shape[1]
     cdef int H = x.shape[2]
     cdef int W = x.shape[3]
-    
+
     cdef int HH = (H + 2 * padding - field_height) // stride + 1
     cdef int WW = (W + 2 * padding - field_width) // stride + 1
 
     cdef int p = padding
-    cdef np.ndarray[DTYPE_t, ndim=4] x_padded = np.pad(x,
-            ((0, 0), (0, 0), (p, p), (p, p)), mode='constant')
+    cdef np.ndarray[DTYPE_t, ndim=4] x_padded = np.ascontiguousarray(np.pad(x,
+            ((0, 0), (0, 0), (p, p), (p, p)), mode='constant'))
 
-    cdef np.ndarray[DTYPE_t, ndim=2] cols = np.zeros(
+    # Every element is written by im2col_cython_inner
+    cdef np.ndarray[DTYPE_t, ndim=2] cols = np.empty(
             (C * field_height * field_width, N * HH * WW),
             dtype=x.dtype)
 
-    # Moving the inner loop to a C function with no bounds checking works, but does
-    # not seem to help performance in any measurable way.
-
-    im2col_cython_inner(cols, x_padded, N, C, H, W, HH, WW,
+    cdef DTYPE_t[:, ::1] cols_view = cols
+    cdef DTYPE_t[:, :, :, ::1] x_padded_view = x_padded
+    im2col_cython_inner(cols_view, x_padded_view, N, C, H, W, HH, WW,
                         field_height, field_width, padding, stride)
     return cols
 
 
 @cython.boundscheck(False)
-cdef int im2col_cython_inner(np.ndarray[DTYPE_t, ndim=2] cols,
-                             np.ndarray[DTYPE_t, ndim=4] x_padded,
+@cython.wraparound(False)
+cdef int im2col_cython_inner(DTYPE_t[:, ::1] cols,
+                             DTYPE_t[:, :, :, ::1] x_padded,
                              int N, int C, int H, int W, int HH, int WW,
                              int field_height, int field_width, int padding, int stride) except? -1:
-    cdef int c, ii, jj, row, yy, xx, i, col
-
-    for c in range(C):
-        for yy in range(HH):
+    cdef int c, ii, jj, row, yy, xx, i, col, task
+    cdef int num_rows = C * field_height * field_width
+
+    # One task per (row, yy) writes the contiguous span of cols
+    # cols[row, yy * WW * N : (yy + 1) * WW * N].
+    with nogil:
+        for task in prange(num_rows * HH, schedule='static'):
+            row = task // HH
+            yy = task % HH
+            c = row // (field_height * field_width)
+            ii = (row // field_width) % field_height
+            jj = row % field_width
+            col = yy * WW * N
             for xx in range(WW):
-                for ii in range(field_height):
-                    for jj in range(field_width):
-                        row = c * field_width * field_height + ii * field_height + jj
-                        for i in range(N):
-                            col = yy * WW * N + xx * N + i
-                            cols[row, col] = x_padded[i, c, stride * yy + ii, stride * xx + jj]
+                for i in range(N):
+                    cols[row, col] = x_padded[i, c, stride * yy + ii, stride * xx + jj]
+                    col = col + 1
+    return 0
 
 
 
@@ -65,7 +79,9 @@ def col2im_cython(np.ndarray[DTYPE_t, ndim=2] cols, int N, int C, int H, int W,
 
     # Moving the inner loop to a C-function with no bounds checking improves
     # performance quite a bit for col2im.
-    col2im_cython_inner(cols, x_padded, N, C, H, W, HH, WW, 
+    cdef DTYPE_t[:, ::1] cols_view = np.ascontiguousarray(cols)
+    cdef DTYPE_t[:, :, :, ::1] x_padded_view = x_padded
+    col2im_cython_inner(cols_view, x_padded_view, N, C, H, W, HH, WW,
                         field_height, field_width, padding, stride)
     if padding > 0:
         return x_padded[:, :, padding:-padding, padding:-padding]
@@ -73,39 +89,51 @@ def col2im_cython(np.ndarray[DTYPE_t, ndim=2] cols, int N, int C, int H, int W,
 
 
 @cython.boundscheck(False)
-cdef int col2im_cython_inner(np.ndarray[DTYPE_t, ndim=2] cols,
-                             np.ndarray[DTYPE_t, ndim=4] x_padded,
+@cython.wraparound(False)
+cdef int col2im_cython_inner(DTYPE_t[:, ::1] cols,
+                             DTYPE_t[:, :, :, ::1] x_padded,
                              int N, int C, int H, int W, int HH, int WW,
                              int field_height, int field_width, int padding, int stride) except? -1:
     cdef int c, ii, jj, row, yy, xx, i, col
 
-    for c in range(C):
-        for ii in range(field_height):
-            for jj in range(field_width):
-                row = c * field_width * field_height + ii * field_height + jj
-                for yy in range(HH):
-                    for xx in range(WW):
-                        for i in range(N):
-                            col = yy * WW * N + xx * N + i
-                            x_padded[i, c, stride * yy + ii, stride * xx + jj] += cols[row, col]
+    # One task per channel; only that task adds into x_padded[:, c], and the
+    # innermost loop reads cols contiguously.
+    with nogil:
+        for c in prange(C, schedule='static'):
+            for ii in range(field_height):
+                for jj in range(field_width):
+                    row = (c * field_height + ii) * field_width + jj
+                    col = 0
+                    for yy in range(HH):
+                        for xx in range(WW):
+                            for i in range(N):
+                                x_padded[i, c, stride * yy + ii, stride * xx + jj] += cols[row, col]
+                                col = col + 1
+    return 0
 
 
 @cython.boundscheck(False)
 @cython.wraparound(False)
-cdef col2im_6d_cython_inner(np.ndarray[DTYPE_t, ndim=6] cols,
-                            np.ndarray[DTYPE_t, ndim=4] x_padded,
-                            int N, int C, int H, int W, int HH, int WW,
-                            int out_h, int out_w, int pad, int stride):
-
-    cdef int c, hh, ww, n, h, w
-    for n in range(N):
-        for c in range(C):
+cdef int col2im_6d_cython_inner(DTYPE_t[:, :, :, :, :, ::1] cols,
+                                DTYPE_t[:, :, :, ::1] x_padded,
+                                int N, int C, int H, int W, int HH, int WW,
+                                int out_h, int out_w, int pad, int stride) except? -1:
+
+    cdef int c, hh, ww, n, h, w, plane
+
+    # One task per (image, channel) plane; the innermost loop reads cols
+    # contiguously.
+    with nogil:
+        for plane in prange(N * C, schedule='static'):
+            n = plane // C
+            c = plane % C
             for hh in range(HH):
                 for ww in range(WW):
                     for h in range(out_h):
                         for w in range(out_w):
                             x_padded[n, c, stride * h + hh, stride * w + ww] += cols[c, hh, ww, n, h, w]
-    
+    return 0
+
 
 def col2im_6d_cython(np.ndarray[DTYPE_t, ndim=6] cols, int N, int C, int H, int W,
         int HH, int WW, int pad, int stride):
@@ -115,8 +143,10 @@ def col2im_6d_cython(np.ndarray[DTYPE_t, ndim=6] cols, int N, int C, int H, int
     cdef np.ndarray[DTYPE_t, ndim=4] x_padded = np.zeros((N, C, H + 2 * pad, W + 2 * pad),
                                                   dtype=cols.dtype)
 
-    col2im_6d_cython_inner(cols, x_padded, N, C, H, W, HH, WW, out_h, out_w, pad, stride)
+    cdef DTYPE_t[:, :, :, :, :, ::1] cols_view = np.ascontiguousarray(cols)
+    cdef DTYPE_t[:, :, :, ::1] x_padded_view = x_padded
+    col2im_6d_cython_inner(cols_view, x_padded_view, N, C, H, W, HH, WW, out_h, out_w, pad, stride)
 
     if pad > 0:
         return x_padded[:, :, pad:-pad, pad:-pad]
-    return x_padded 
+    return x_padded
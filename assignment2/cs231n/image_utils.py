@@ -29,7 +29,7 @@ def blur_image(X):
 
     w_blur = np.zeros((3, 3, 3, 3))
     b_blur = np.zeros(3)
-    blur_param = {"stride": 1, "pad": 1}
+    blur_param = {"stride": 1, "pad": 1, "fixed_filters": True}
     for i in range(3):
         w_blur[i, i] = np.asarray([[1, 2, 1], [2, 188, 2], [1, 2, 1]], dtype=np.float32)
     w_blur /= 200.0
@@ -1,18 +1,65 @@
 from .layers import *
 from .fast_layers import *
+from .workspace import Workspace
 
 
-def affine_relu_forward(x, w, b):
+def _affine_forward_workspace(x, w, b, workspace):
+    """affine_forward writing its output into a workspace buffer."""
+    x_rows = x.reshape(x.shape[0], -1)
+    out = workspace.get("affine_out", (x.shape[0], w.shape[1]), np.result_type(x, w))
+    np.dot(x_rows, w, out=out)
+    out += b
+    return out, (x, w, b)
+
+
+def _affine_backward_workspace(dout, cache, workspace):
+    """affine_backward writing its gradients into workspace buffers."""
+    x, w, b = cache
+    x_rows = x.reshape(x.shape[0], -1)
+    dx = workspace.get("affine_dx", x_rows.shape, np.result_type(dout, w))
+    np.dot(dout, w.T, out=dx)
+    dw = workspace.get("affine_dw", w.shape, np.result_type(x, dout))
+    np.dot(x_rows.T, dout, out=dw)
+    db = workspace.get("affine_db", b.shape, dout.dtype)
+    np.sum(dout, axis=0, out=db)
+    return dx.reshape(x.shape), dw, db
+
+
+def _relu_forward_inplace(x, workspace):
+    """ReLU applied in place on x; the cache is a boolean mask of x > 0."""
+    mask = workspace.get("relu_mask", x.shape, np.bool_)
+    np.greater(x, 0, out=mask)
+    np.maximum(x, 0, out=x)
+    return x, mask
+
+
+def _relu_backward_mask(dout, mask, workspace):
+    """Backward pass for _relu_forward_inplace."""
+    dx = workspace.get("relu_dx", dout.shape, dout.dtype)
+    np.multiply(dout, mask, out=dx)
+    return dx
+
+
+def affine_relu_forward(x, w, b, workspace=None):
     """Convenience layer that performs an affine transform followed by a ReLU.
 
     Inputs:
     - x: Input to the affine layer
     - w, b: Weights for the affine layer
+    - workspace: Optional Workspace owned by this layer. If given, the output
+      and the gradients of the backward pass are written into its buffers
+      (and overwritten by the next call), the ReLU runs in place and the
+      cache keeps a boolean mask instead of the pre-activation.
 
     Returns a tuple of:
     - out: Output from the ReLU
     - cache: Object to give to the backward pass
     """
+    if workspace is not None:
+        a, fc_cache = _affine_forward_workspace(x, w, b, workspace)
+        out, relu_mask = _relu_forward_inplace(a, workspace)
+        return out, (fc_cache, relu_mask, workspace)
+
     a, fc_cache = affine_forward(x, w, b)
     out, relu_cache = relu_forward(a)
     cache = (fc_cache, relu_cache)
@@ -21,6 +68,11 @@ def affine_relu_forward(x, w, b):
 def affine_relu_backward(dout, cache):
     """Backward pass for the affine-relu convenience layer.
     """
+    if isinstance(cache[-1], Workspace):
+        fc_cache, relu_mask, workspace = cache
+        da = _relu_backward_mask(dout, relu_mask, workspace)
+        return _affine_backward_workspace(da, fc_cache, workspace)
+
     fc_cache, relu_cache = cache
     da = relu_backward(dout, relu_cache)
     dx, dw, db = affine_backward(da, fc_cache)
@@ -28,7 +80,15 @@ def affine_relu_backward(dout, cache):
 
 # *****START OF YOUR CODE (DO NOT DELETE/MODIFY THIS LINE)*****
 
-def affine_bn_relu_forward(x, w, b, gamma, beta, bn_param):
+def affine_bn_relu_forward(x, w, b, gamma, beta, bn_param, workspace=None):
+    if workspace is not None:
+        # Same as affine_relu_forward with a workspace; batchnorm caches its
+        # own normalized input, so the ReLU can overwrite its output.
+        affine_out,affine_cache = _affine_forward_workspace(x, w, b, workspace)
+        bn_out,bn_cache = batchnorm_forward(affine_out, gamma, beta, bn_param)
+        relu_out,relu_mask = _relu_forward_inplace(bn_out, workspace)
+        cache = (affine_cache, bn_cache, relu_mask, workspace)
+        return relu_out, cache
     affine_out,affine_cache = affine_forward(x, w, b)
     bn_out,bn_cache = batchnorm_forward(affine_out, gamma, beta, bn_param)
     relu_out,relu_cache = relu_forward(bn_out)
@@ -36,6 +96,12 @@ def affine_bn_relu_forward(x, w, b, gamma, beta, bn_param):
     return relu_out, cache
 
 def affine_bn_relu_backward(dout, cache):
+    if isinstance(cache[-1], Workspace):
+        affine_cache, bn_cache, relu_mask, workspace = cache
+        drelu_out = _relu_backward_mask(dout, relu_mask, workspace)
+        dbn_out, dgamma, dbeta = batchnorm_backward(drelu_out, bn_cache)
+        dx, dw, db = _affine_backward_workspace(dbn_out, affine_cache, workspace)
+        return dx, dw, db, dgamma, dbeta
     affine_cache, bn_cache, relu_cache = cache
     drelu_out = relu_backward(dout, relu_cache)
     dbn_out, dgamma, dbeta = batchnorm_backward(drelu_out, bn_cache)
@@ -70,7 +136,7 @@ def conv_relu_backward(dout, cache):
     return dx, dw, db
 
 
-def conv_bn_relu_forward(x, w, b, gamma, beta, conv_param, bn_param):
+def conv_bn_relu_forward(x, w, b, gamma, beta, conv_param, bn_param, workspace=None):
     """Convenience layer that performs a convolution, a batch normalization, and a ReLU.
 
     Inputs:
@@ -80,6 +146,9 @@ def conv_bn_relu_forward(x, w, b, gamma, beta, conv_param, bn_param):
     - gamma, beta: Arrays of shape (D2,) and (D2,) giving scale and shift
       parameters for batch normalization.
     - bn_param: Dictionary of parameters for batch normalization.
+    - workspace: Optional Workspace owned by this layer. If given, the ReLU
+      runs in place and the cache keeps a boolean mask instead of the
+      normalized activations; see affine_relu_forward.
 
     Returns a tuple of:
     - out: Output from the pooling layer
@@ -87,6 +156,9 @@ def conv_bn_relu_forward(x, w, b, gamma, beta, conv_param, bn_param):
     """
     a, conv_cache = conv_forward_fast(x, w, b, conv_param)
     an, bn_cache = spatial_batchnorm_forward(a, gamma, beta, bn_param)
+    if workspace is not None:
+        out, relu_mask = _relu_forward_inplace(an, workspace)
+        return out, (conv_cache, bn_cache, relu_mask, workspace)
     out, relu_cache = relu_forward(an)
     cache = (conv_cache, bn_cache, relu_cache)
     return out, cache
@@ -95,8 +167,12 @@ def conv_bn_relu_forward(x, w, b, gamma, beta, conv_param, bn_param):
 def conv_bn_relu_backward(dout, cache):
     """Backward pass for the conv-bn-relu convenience layer.
     """
-    conv_cache, bn_cache, relu_cache = cache
-    dan = relu_backward(dout, relu_cache)
+    if isinstance(cache[-1], Workspace):
+        conv_cache, bn_cache, relu_mask, workspace = cache
+        dan = _relu_backward_mask(dout, relu_mask, workspace)
+    else:
+        conv_cache, bn_cache, relu_cache = cache
+        dan = relu_backward(dout, relu_cache)
     da, dgamma, dbeta = spatial_batchnorm_backward(dan, bn_cache)
     dx, dw, db = conv_backward_fast(da, conv_cache)
     return dx, dw, db, dgamma, dbeta
@@ -119,7 +119,7 @@ def relu_backward(dout, cache):
     ###########################################################################
     # *****START OF YOUR CODE (DO NOT DELETE/MODIFY THIS LINE)*****
 
-    dx = dout * np.where(x > 0, 1, 0)
+    dx = dout * (x > 0)
 
     # *****END OF YOUR CODE (DO NOT DELETE/MODIFY THIS LINE)*****
     ###########################################################################
@@ -173,6 +173,10 @@ def batchnorm_forward(x, gamma, beta, bn_param):
     N, D = x.shape
     running_mean = bn_param.get("running_mean", np.zeros(D, dtype=x.dtype))
     running_var = bn_param.get("running_var", np.zeros(D, dtype=x.dtype))
+    # Keep the running statistics in the dtype of x so that neither the
+    # test-time normalization nor the running average promotes it
+    running_mean = running_mean.astype(x.dtype, copy=False)
+    running_var = running_var.astype(x.dtype, copy=False)
 
     out, cache = None, None
     if mode == "train":
@@ -475,7 +479,7 @@ def dropout_forward(x, dropout_param):
         #######################################################################
         # *****START OF YOUR CODE (DO NOT DELETE/MODIFY THIS LINE)*****
 
-        mask = (np.random.rand(*x.shape) < p) / p
+        mask = ((np.random.rand(*x.shape) < p) / p).astype(x.dtype)
         out = x * mask
 
         # *****END OF YOUR CODE (DO NOT DELETE/MODIFY THIS LINE)*****
@@ -580,7 +584,7 @@ def conv_forward_naive(x, w, b, conv_param):
     # 将卷积核w转换成F * (C * HH * WW)的矩阵 (便于使用矩阵乘法)
     w_row = w.reshape(F, -1)
     # 生成空白输出便于后续循环填充
-    out = np.zeros((N, F, out_H, out_W))
+    out = np.zeros((N, F, out_H, out_W), dtype=x.dtype)
 
     # 开始卷积
     for n in range(N):  # 遍历样本
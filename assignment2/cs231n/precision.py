@@ -0,0 +1,113 @@
+from contextlib import contextmanager
+import functools
+import importlib
+
+import numpy as np
+
+"""
+Debugging help for reduced precision training. Inside a check_dtype(dtype)
+block, every layer function of the modules in CHECKED_MODULES (every function
+whose name ends in _forward, _backward or _loss) and of the registries in
+CHECKED_REGISTRIES raises an AssertionError as soon as it returns a floating
+point array of any other dtype, naming itself and the dtypes of its floating
+point inputs. Since layers return before the layers that call them, the error
+names the first, innermost, layer that promoted.
+
+Example usage:
+
+model = ThreeLayerConvNet(dtype=np.float32)
+with check_dtype(np.float32):
+    loss, grads = model.loss(X.astype(np.float32), y)
+
+Solver enables this on every training step with check_dtype=<dtype>.
+"""
+
+# Modules whose layer functions are checked, relative to this package. The
+# classifier modules are included because they hold their own references to
+# the layer functions through "from ..layers import *".
+CHECKED_MODULES = (
+    ".layers",
+    ".fast_layers",
+    ".layer_utils",
+    ".classifiers.fc_net",
+    ".classifiers.cnn",
+)
+
+# Registries of (forward, backward) pairs that dispatchers call through
+# instead of through module attributes; their entries are checked as well, so
+# that a promotion inside, say, conv_forward_fft is reported as such rather
+# than as conv_forward_fast.
+CHECKED_REGISTRIES = ((".fast_layers", "CONV_METHODS"),)
+
+_LAYER_SUFFIXES = ("_forward", "_backward", "_loss")
+
+
+def _floating_dtypes(values):
+    """ Dtypes of the floating point arrays among values """
+    return [
+        v.dtype
+        for v in values
+        if isinstance(v, np.ndarray) and np.issubdtype(v.dtype, np.floating)
+    ]
+
+
+def _checked(fn, dtype):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        result = fn(*args, **kwargs)
+        # Check the arrays returned directly (out, dx, dw, ...) and skip
+        # caches, which may legitimately hold masks or indices.
+        outputs = result if isinstance(result, tuple) else (result,)
+        for out_dtype in _floating_dtypes(outputs):
+            if out_dtype != dtype:
+                in_dtypes = _floating_dtypes(list(args) + list(kwargs.values()))
+                raise AssertionError(
+                    "%s returned %s (expected %s); floating point inputs: %s"
+                    % (
+                        fn.__name__,
+                        out_dtype,
+                        dtype,
+                        ", ".join(str(d) for d in in_dtypes) or "none",
+                    )
+                )
+        return result
+
+    return wrapper
+
+
+@contextmanager
+def check_dtype(dtype):
+    """
+    Context manager that makes every layer function in CHECKED_MODULES raise
+    an AssertionError if it returns a floating point array that is not of the
+    given dtype. The original functions are restored on exit.
+    """
+    dtype = np.dtype(dtype)
+    wrappers = {}
+
+    def wrap(fn):
+        if id(fn) not in wrappers:
+            wrappers[id(fn)] = _checked(fn, dtype)
+        return wrappers[id(fn)]
+
+    patched = []
+    for name in CHECKED_MODULES:
+        module = importlib.import_module(name, __package__)
+        for attr, fn in list(vars(module).items()):
+            if not callable(fn) or not attr.endswith(_LAYER_SUFFIXES):
+                continue
+            setattr(module, attr, wrap(fn))
+            patched.append((module, attr, fn))
+    patched_entries = []
+    for name, attr in CHECKED_REGISTRIES:
+        registry = getattr(importlib.import_module(name, __package__), attr)
+        for key, fns in list(registry.items()):
+            registry[key] = tuple(wrap(fn) for fn in fns)
+            patched_entries.append((registry, key, fns))
+    try:
+        yield
+    finally:
+        for module, attr, fn in patched:
+            setattr(module, attr, fn)
+        for registry, key, fns in patched_entries:
+            registry[key] = fns
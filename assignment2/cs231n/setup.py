@@ -1,11 +1,28 @@
+import os
+import sys
+
 from distutils.core import setup
 from distutils.extension import Extension
 from Cython.Build import cythonize
 import numpy
 
+# The im2col / col2im loops are parallelized with OpenMP. Compilers without
+# OpenMP support (e.g. Apple clang) can build with CS231N_NO_OPENMP=1 set;
+# the loops then run on a single thread.
+if "CS231N_NO_OPENMP" in os.environ:
+    openmp_args = []
+elif sys.platform == "win32":
+    openmp_args = ["/openmp"]
+else:
+    openmp_args = ["-fopenmp"]
+
 extensions = [
     Extension(
-        "im2col_cython", ["im2col_cython.pyx"], include_dirs=[numpy.get_include()]
+        "im2col_cython",
+        ["im2col_cython.pyx"],
+        include_dirs=[numpy.get_include()],
+        extra_compile_args=openmp_args,
+        extra_link_args=[] if sys.platform == "win32" else openmp_args,
     ),
 ]
 
@@ -10,6 +10,8 @@ import pickle as pickle
 import numpy as np
 
 from cs231n import optim
+from cs231n import batch_source
+from cs231n import precision
 
 
 class Solver(object):
@@ -114,6 +116,24 @@ class Solver(object):
           accuracy; default is None, which uses the entire validation set.
         - checkpoint_name: If not None, then save model checkpoints here every
           epoch.
+        - batch_source: How training minibatches are drawn. Either 'random'
+          (default; independent sampling with replacement), 'epoch' (shuffle
+          once per epoch and sample without replacement), or an object
+          implementing the batch source API from batch_source.py. Only
+          next_batch() is required of such an object; the solver never closes
+          it, since the caller owns it.
+        - prefetch: Integer; if greater than zero, minibatches are gathered and
+          cast to model.dtype on a background thread, keeping this many
+          batches ready ahead of the current step. Default is 0.
+        - master_dtype: If not None (e.g. np.float64), the solver keeps a copy
+          of every parameter in this dtype, applies the update rule to that
+          copy, and writes it back to model.params cast to the model's dtype.
+          This lets a float32 model accumulate small updates without losing
+          them to rounding. Default is None (update model.params directly).
+        - check_dtype: If not None (e.g. np.float32), every training step runs
+          inside precision.check_dtype, so the first layer that returns a
+          floating point array of another dtype raises an AssertionError.
+          This is slow; use it for debugging. Default is None.
         """
         self.model = model
         self.X_train = data["X_train"]
@@ -133,6 +153,10 @@ class Solver(object):
         self.checkpoint_name = kwargs.pop("checkpoint_name", None)
         self.print_every = kwargs.pop("print_every", 10)
         self.verbose = kwargs.pop("verbose", True)
+        self.batch_source = kwargs.pop("batch_source", "random")
+        self.prefetch = kwargs.pop("prefetch", 0)
+        self.master_dtype = kwargs.pop("master_dtype", None)
+        self.check_dtype = kwargs.pop("check_dtype", None)
 
         # Throw an error if there are extra keyword arguments
         if len(kwargs) > 0:
@@ -160,32 +184,81 @@ class Solver(object):
         self.train_acc_history = []
         self.val_acc_history = []
 
+        # Master copies of the parameters that the update rule is applied to
+        self.master_params = {}
+        if self.master_dtype is not None:
+            for p, w in self.model.params.items():
+                self.master_params[p] = w.astype(self.master_dtype)
+
         # Make a deep copy of the optim_config for each parameter
         self.optim_configs = {}
         for p in self.model.params:
             d = {k: v for k, v in self.optim_config.items()}
             self.optim_configs[p] = d
 
+    def _make_batch_source(self):
+        """
+        Build the batch source used by _step() from the batch_source and
+        prefetch options. Don't call this manually.
+
+        Returns a tuple (source, owned); owned is False when source is the
+        caller's own batch source, which train() then leaves open.
+        """
+        # Sources sampled on the prefetch thread get their own generator,
+        # seeded from np.random here on the main thread.
+        seed = np.random.randint(2 ** 31) if self.prefetch > 0 else None
+        owned = True
+        if self.batch_source == "random":
+            source = batch_source.RandomBatchSource(
+                self.X_train, self.y_train, self.batch_size, seed
+            )
+        elif self.batch_source == "epoch":
+            source = batch_source.EpochBatchSource(
+                self.X_train, self.y_train, self.batch_size, seed
+            )
+        elif hasattr(self.batch_source, "next_batch"):
+            source = self.batch_source
+            owned = False
+        else:
+            raise ValueError('Invalid batch_source "%s"' % self.batch_source)
+
+        if self.prefetch > 0:
+            dtype = getattr(self.model, "dtype", None)
+            source = batch_source.PrefetchBatchSource(
+                source, self.prefetch, dtype, close_source=owned
+            )
+            owned = True
+        return source, owned
+
     def _step(self):
         """
         Make a single gradient update. This is called by train() and should not
         be called manually.
         """
         # Make a minibatch of training data
-        num_train = self.X_train.shape[0]
-        batch_mask = np.random.choice(num_train, self.batch_size)
-        X_batch = self.X_train[batch_mask]
-        y_batch = self.y_train[batch_mask]
+        X_batch, y_batch = self._source.next_batch()
 
         # Compute loss and gradient
-        loss, grads = self.model.loss(X_batch, y_batch)
+        if self.check_dtype is not None:
+            with precision.check_dtype(self.check_dtype):
+                loss, grads = self.model.loss(X_batch, y_batch)
+        else:
+            loss, grads = self.model.loss(X_batch, y_batch)
         self.loss_history.append(loss)
 
         # Perform a parameter update
         for p, w in self.model.params.items():
             dw = grads[p]
             config = self.optim_configs[p]
-            next_w, next_config = self.update_rule(w, dw, config)
+            if p in self.master_params:
+                master = self.master_params[p]
+                next_w, next_config = self.update_rule(
+                    master, dw.astype(master.dtype), config
+                )
+                self.master_params[p] = next_w
+                next_w = next_w.astype(w.dtype)
+            else:
+                next_w, next_config = self.update_rule(w, dw, config)
             self.model.params[p] = next_w
             self.optim_configs[p] = next_config
 
@@ -259,6 +332,21 @@ class Solver(object):
         iterations_per_epoch = max(num_train // self.batch_size, 1)
         num_iterations = self.num_epochs * iterations_per_epoch
 
+        self._source, owned = self._make_batch_source()
+        try:
+            self._train_loop(num_iterations, iterations_per_epoch)
+        finally:
+            if owned:
+                self._source.close()
+
+        # At the end of training swap the best params into the model
+        self.model.params = self.best_params
+
+    def _train_loop(self, num_iterations, iterations_per_epoch):
+        """
+        Run num_iterations steps of optimization. This is called by train() and
+        should not be called manually.
+        """
         for t in range(num_iterations):
             self._step()
 
@@ -304,6 +392,3 @@ class Solver(object):
                     self.best_params = {}
                     for k, v in self.model.params.items():
                         self.best_params[k] = v.copy()
-
-        # At the end of training swap the best params into the model
-        self.model.params = self.best_params
@@ -0,0 +1,36 @@
+from builtins import object
+import numpy as np
+
+
+class Workspace(object):
+    """
+    Scratch buffers owned by one layer of a model and reused from one
+    forward / backward pass to the next, so that a training loop with a fixed
+    batch size stops allocating activations and gradients after its first
+    iteration.
+
+    There is one buffer per name, reallocated whenever the requested shape or
+    dtype changes, so a workspace never holds more than one buffer per name.
+    Alternating between batch sizes (say a final partial batch or
+    check_accuracy chunks) reallocates rather than keeping a buffer for every
+    size.
+
+    Arrays returned by get(), and therefore any activation or gradient that a
+    layer computes in a workspace, are overwritten by the next call that uses
+    the same name.
+    """
+
+    def __init__(self):
+        self.buffers = {}
+
+    def get(self, name, shape, dtype):
+        """
+        Return an uninitialized C-contiguous buffer called name with the given
+        shape and dtype.
+        """
+        dtype = np.dtype(dtype)
+        buf = self.buffers.get(name)
+        if buf is None or buf.shape != tuple(shape) or buf.dtype != dtype:
+            buf = np.empty(shape, dtype=dtype)
+            self.buffers[name] = buf
+        return buf
@@ -0,0 +1,182 @@
+"""
+Forward / backward equivalence of the fast convolution backends with
+conv_forward_naive / conv_backward_naive.
+"""
+import numpy as np
+import pytest
+
+from cs231n import fast_layers
+from cs231n.layers import conv_forward_naive, conv_backward_naive
+
+# (x shape, w shape, conv_param); odd sizes, padding and stride 2 included
+CONV_CASES = [
+    ((2, 3, 8, 8), (4, 3, 3, 3), {"stride": 1, "pad": 1}),
+    ((3, 2, 7, 9), (5, 2, 3, 3), {"stride": 1, "pad": 1}),
+    ((3, 2, 7, 9), (5, 2, 3, 3), {"stride": 1, "pad": 0}),
+    ((2, 3, 9, 9), (4, 3, 3, 3), {"stride": 2, "pad": 1}),
+    ((2, 3, 11, 7), (3, 3, 5, 5), {"stride": 2, "pad": 2}),
+    ((1, 4, 6, 6), (2, 4, 1, 1), {"stride": 1, "pad": 0}),
+    ((2, 1, 10, 10), (3, 1, 7, 7), {"stride": 1, "pad": 3}),
+]
+
+
+def _random_conv(x_shape, w_shape, seed=0):
+    rng = np.random.RandomState(seed)
+    x = rng.randn(*x_shape)
+    w = rng.randn(*w_shape)
+    b = rng.randn(w_shape[0])
+    return x, w, b
+
+
+def check_conv_backend(forward, backward, x_shape, w_shape, conv_param):
+    """ Compare a forward / backward pair with the naive layers """
+    x, w, b = _random_conv(x_shape, w_shape)
+    out, cache = forward(x, w, b, conv_param)
+    out_naive, cache_naive = conv_forward_naive(x, w, b, conv_param)
+    np.testing.assert_allclose(out, out_naive, rtol=1e-10, atol=1e-10)
+
+    dout = np.random.RandomState(1).randn(*out.shape)
+    for grad, grad_naive in zip(backward(dout, cache), conv_backward_naive(dout, cache_naive)):
+        assert grad.shape == grad_naive.shape
+        np.testing.assert_allclose(grad, grad_naive, rtol=1e-10, atol=1e-10)
+
+
+@pytest.mark.parametrize("x_shape, w_shape, conv_param", CONV_CASES)
+def test_conv_blocked(x_shape, w_shape, conv_param):
+    check_conv_backend(
+        fast_layers.conv_forward_blocked,
+        fast_layers.conv_backward_blocked,
+        x_shape,
+        w_shape,
+        conv_param,
+    )
+
+
+@pytest.mark.parametrize("x_shape, w_shape, conv_param", CONV_CASES)
+def test_conv_blocked_small_tiles(x_shape, w_shape, conv_param):
+    # A budget of one byte forces one image per tile
+    conv_param = dict(conv_param, tile_bytes=1)
+    check_conv_backend(
+        fast_layers.conv_forward_blocked,
+        fast_layers.conv_backward_blocked,
+        x_shape,
+        w_shape,
+        conv_param,
+    )
+
+
+WINOGRAD_CASES = [
+    case for case in CONV_CASES if case[1][2:] == (3, 3) and case[2]["stride"] == 1
+]
+
+
+@pytest.mark.parametrize("x_shape, w_shape, conv_param", WINOGRAD_CASES)
+def test_conv_winograd(x_shape, w_shape, conv_param):
+    check_conv_backend(
+        fast_layers.conv_forward_winograd,
+        fast_layers.conv_backward_winograd,
+        x_shape,
+        w_shape,
+        conv_param,
+    )
+
+
+@pytest.mark.parametrize(
+    "w_shape, conv_param",
+    [
+        ((4, 3, 5, 5), {"stride": 1, "pad": 2}),
+        ((4, 3, 3, 3), {"stride": 2, "pad": 1}),
+    ],
+)
+def test_conv_winograd_rejects(w_shape, conv_param):
+    x, w, b = _random_conv((2, 3, 9, 9), w_shape)
+    with pytest.raises(AssertionError):
+        fast_layers.conv_forward_winograd(x, w, b, conv_param)
+
+
+@pytest.mark.parametrize("x_shape, w_shape, conv_param", CONV_CASES)
+def test_conv_fft(x_shape, w_shape, conv_param):
+    check_conv_backend(
+        fast_layers.conv_forward_fft,
+        fast_layers.conv_backward_fft,
+        x_shape,
+        w_shape,
+        conv_param,
+    )
+
+
+def test_conv_fft_filter_cache():
+    x, w, b = _random_conv((2, 3, 8, 8), (4, 3, 5, 5))
+    conv_param = {"stride": 1, "pad": 2}
+    fast_layers._FFT_FILTER_CACHE.clear()
+
+    # Trained filters are not kept across calls
+    fast_layers.conv_forward_fft(x, w, b, conv_param)
+    assert len(fast_layers._FFT_FILTER_CACHE) == 0
+
+    # Fixed filters are transformed once and give the same result
+    fixed_param = dict(conv_param, fixed_filters=True)
+    out = fast_layers.conv_forward_fft(x, w, b, fixed_param)[0]
+    out_cached = fast_layers.conv_forward_fft(x, w, b, fixed_param)[0]
+    assert len(fast_layers._FFT_FILTER_CACHE) == 1
+    np.testing.assert_array_equal(out, out_cached)
+    np.testing.assert_allclose(
+        out, conv_forward_naive(x, w, b, conv_param)[0], rtol=1e-10, atol=1e-10
+    )
+    fast_layers._FFT_FILTER_CACHE.clear()
+
+
+@pytest.fixture
+def autotune(monkeypatch, tmp_path):
+    """ Auto-tuning with an empty table, saved to a temporary file """
+    filename = str(tmp_path / "conv_autotune.json")
+    monkeypatch.setattr(fast_layers, "CONV_AUTOTUNE", True)
+    monkeypatch.setattr(fast_layers, "CONV_AUTOTUNE_CACHE", filename)
+    monkeypatch.setattr(fast_layers, "CONV_AUTOTUNE_REPEATS", 1)
+    monkeypatch.setattr(fast_layers, "_conv_autotune_table", {})
+    monkeypatch.setattr(fast_layers, "_conv_autotune_loaded", set())
+    return filename
+
+
+@pytest.mark.parametrize("x_shape, w_shape, conv_param", CONV_CASES)
+def test_conv_autotune(autotune, x_shape, w_shape, conv_param):
+    x, w, b = _random_conv(x_shape, w_shape)
+    method, timings = fast_layers.conv_autotune(x, w, b, conv_param)
+    assert method in fast_layers.CONV_AUTOTUNE_METHODS
+    assert method == min(timings, key=timings.get)
+    if w_shape[2:] != (3, 3) or conv_param["stride"] != 1:
+        assert "winograd" not in timings
+
+    # The decision is reused, and conv_forward_fast follows it
+    assert fast_layers.conv_autotune(x, w, b, conv_param) == (method, {})
+    assert fast_layers.conv_forward_fast(x, w, b, conv_param)[1][0] == method
+    check_conv_backend(
+        fast_layers.conv_forward_fast,
+        fast_layers.conv_backward_fast,
+        x_shape,
+        w_shape,
+        conv_param,
+    )
+
+
+def test_conv_autotune_cache_file(autotune, monkeypatch):
+    x, w, b = _random_conv((2, 3, 8, 8), (4, 3, 3, 3))
+    conv_param = {"stride": 1, "pad": 1}
+    method = fast_layers.conv_autotune(x, w, b, conv_param)[0]
+
+    # A new session loads the decision instead of benchmarking again
+    monkeypatch.setattr(fast_layers, "_conv_autotune_table", {})
+    monkeypatch.setattr(fast_layers, "_conv_autotune_loaded", set())
+    assert fast_layers.conv_autotune(x, w, b, conv_param) == (method, {})
+
+
+@pytest.mark.parametrize("x_shape, w_shape, conv_param", CONV_CASES)
+def test_conv_fast_without_autotune(monkeypatch, x_shape, w_shape, conv_param):
+    monkeypatch.setattr(fast_layers, "CONV_AUTOTUNE", False)
+    check_conv_backend(
+        fast_layers.conv_forward_fast,
+        fast_layers.conv_backward_fast,
+        x_shape,
+        w_shape,
+        conv_param,
+    )
@@ -0,0 +1,60 @@
+"""
+Forward / backward equivalence of the fused conv-relu-pool layer with the
+naive conv, ReLU and max pooling layers chained together.
+"""
+import numpy as np
+import pytest
+
+from cs231n.layers import (
+    conv_forward_naive,
+    conv_backward_naive,
+    relu_forward,
+    relu_backward,
+    max_pool_forward_naive,
+    max_pool_backward_naive,
+)
+from cs231n.layer_utils import conv_relu_pool_fused_forward, conv_relu_pool_fused_backward
+
+POOL_2X2 = {"pool_height": 2, "pool_width": 2, "stride": 2}
+
+# (x shape, w shape, conv_param, pool_param)
+FUSED_CASES = [
+    ((2, 3, 8, 8), (4, 3, 3, 3), {"stride": 1, "pad": 1}, POOL_2X2),
+    ((3, 2, 7, 9), (5, 2, 3, 3), {"stride": 1, "pad": 1}, POOL_2X2),
+    ((2, 3, 9, 9), (4, 3, 3, 3), {"stride": 2, "pad": 1}, POOL_2X2),
+    ((2, 3, 12, 12), (3, 3, 5, 5), {"stride": 1, "pad": 2}, POOL_2X2),
+    (
+        (2, 3, 9, 9),
+        (4, 3, 3, 3),
+        {"stride": 1, "pad": 1},
+        {"pool_height": 3, "pool_width": 3, "stride": 2},
+    ),
+]
+
+
+def conv_relu_pool_naive(x, w, b, conv_param, pool_param, dout):
+    a, conv_cache = conv_forward_naive(x, w, b, conv_param)
+    s, relu_cache = relu_forward(a)
+    out, pool_cache = max_pool_forward_naive(s, pool_param)
+    ds = max_pool_backward_naive(dout, pool_cache)
+    da = relu_backward(ds, relu_cache)
+    return (out,) + conv_backward_naive(da, conv_cache)
+
+
+@pytest.mark.parametrize("bias", [0.0, -2.0])
+@pytest.mark.parametrize("x_shape, w_shape, conv_param, pool_param", FUSED_CASES)
+def test_conv_relu_pool_fused(x_shape, w_shape, conv_param, pool_param, bias):
+    # A negative bias zeroes most ReLU outputs, so many pooling windows tie
+    rng = np.random.RandomState(0)
+    x = rng.randn(*x_shape)
+    w = rng.randn(*w_shape)
+    b = rng.randn(w_shape[0]) + bias
+
+    out, cache = conv_relu_pool_fused_forward(x, w, b, conv_param, pool_param)
+    dout = rng.randn(*out.shape)
+    dx, dw, db = conv_relu_pool_fused_backward(dout, cache)
+
+    expected = conv_relu_pool_naive(x, w, b, conv_param, pool_param, dout)
+    for value, value_naive in zip((out, dx, dw, db), expected):
+        assert value.shape == value_naive.shape
+        np.testing.assert_allclose(value, value_naive, rtol=1e-10, atol=1e-10)
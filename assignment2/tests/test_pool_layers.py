@@ -0,0 +1,109 @@
+"""
+Forward / backward equivalence of the fast max pooling layers with
+max_pool_forward_naive / max_pool_backward_naive.
+"""
+import numpy as np
+import pytest
+
+from cs231n import fast_layers
+from cs231n.layers import max_pool_forward_naive, max_pool_backward_naive
+
+# (x shape, pool_param); overlapping, non-square and non-tiling windows
+POOL_CASES = [
+    ((2, 3, 8, 8), {"pool_height": 2, "pool_width": 2, "stride": 2}),
+    ((2, 3, 9, 9), {"pool_height": 3, "pool_width": 3, "stride": 2}),
+    ((3, 2, 7, 5), {"pool_height": 3, "pool_width": 2, "stride": 1}),
+    ((2, 2, 9, 7), {"pool_height": 2, "pool_width": 2, "stride": 2}),
+    ((1, 1, 6, 6), {"pool_height": 6, "pool_width": 6, "stride": 1}),
+]
+
+# Windows that tile the input, as max_pool_forward_reshape requires
+TILING_CASES = [
+    ((2, 3, 8, 8), {"pool_height": 2, "pool_width": 2, "stride": 2}),
+    ((3, 2, 9, 6), {"pool_height": 3, "pool_width": 3, "stride": 3}),
+    ((1, 4, 4, 4), {"pool_height": 4, "pool_width": 4, "stride": 4}),
+]
+
+
+def _pool_input(x_shape, ties, seed=0):
+    rng = np.random.RandomState(seed)
+    if ties:
+        # Few distinct values, so most windows have several maxima
+        return rng.randint(0, 3, size=x_shape).astype(np.float64)
+    return rng.randn(*x_shape)
+
+
+def check_pool_layer(forward, backward, x, pool_param):
+    """ Compare a forward / backward pair with the naive layers """
+    out, cache = forward(x, pool_param)
+    out_naive, cache_naive = max_pool_forward_naive(x, pool_param)
+    np.testing.assert_array_equal(out, out_naive)
+
+    dout = np.random.RandomState(1).randn(*out.shape)
+    dx = backward(dout, cache)
+    dx_naive = max_pool_backward_naive(dout, cache_naive)
+    assert dx.shape == x.shape
+    np.testing.assert_allclose(dx, dx_naive, rtol=1e-12, atol=1e-12)
+
+
+@pytest.mark.parametrize("ties", [False, True])
+@pytest.mark.parametrize("x_shape, pool_param", POOL_CASES)
+def test_max_pool_strides(x_shape, pool_param, ties):
+    check_pool_layer(
+        fast_layers.max_pool_forward_strides,
+        fast_layers.max_pool_backward_strides,
+        _pool_input(x_shape, ties),
+        pool_param,
+    )
+
+
+@pytest.mark.parametrize("x_shape, pool_param", POOL_CASES)
+def test_max_pool_fast(x_shape, pool_param):
+    # Dispatches to the reshape or the strides method depending on the shape.
+    # No ties: the reshape backward splits the gradient between tied maxima.
+    check_pool_layer(
+        fast_layers.max_pool_forward_fast,
+        fast_layers.max_pool_backward_fast,
+        _pool_input(x_shape, False),
+        pool_param,
+    )
+
+
+@pytest.mark.parametrize("ties", [False, True])
+@pytest.mark.parametrize("x_shape, pool_param", TILING_CASES)
+def test_max_pool_reshape_argmax_code(x_shape, pool_param, ties):
+    pool_param = dict(pool_param, argmax_code=True)
+    x = _pool_input(x_shape, ties)
+    check_pool_layer(
+        fast_layers.max_pool_forward_reshape,
+        fast_layers.max_pool_backward_reshape,
+        x,
+        pool_param,
+    )
+    check_pool_layer(
+        fast_layers.max_pool_forward_fast,
+        fast_layers.max_pool_backward_fast,
+        x,
+        pool_param,
+    )
+
+    # The cache keeps uint8 codes instead of x
+    cache = fast_layers.max_pool_forward_reshape(x, pool_param)[1]
+    assert cache[-1].dtype == np.uint8
+    assert not any(isinstance(c, np.ndarray) and c.shape == x.shape for c in cache)
+
+
+@pytest.mark.parametrize(
+    "x_shape, pool_param",
+    [
+        # Windows that do not tile the input
+        ((1, 1, 7, 7), {"pool_height": 2, "pool_width": 2, "stride": 2}),
+        ((1, 1, 9, 9), {"pool_height": 3, "pool_width": 3, "stride": 2}),
+        # More than 256 positions per window
+        ((1, 1, 17, 17), {"pool_height": 17, "pool_width": 17, "stride": 17}),
+    ],
+)
+def test_max_pool_reshape_argmax_code_rejects(x_shape, pool_param):
+    x = _pool_input(x_shape, False)
+    with pytest.raises(AssertionError):
+        fast_layers.max_pool_forward_reshape(x, dict(pool_param, argmax_code=True))
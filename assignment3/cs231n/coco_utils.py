@@ -1,11 +1,94 @@
 import os, json
+from collections import OrderedDict
 import numpy as np
 import h5py
 
 dir_path = os.path.dirname(os.path.realpath(__file__))
 BASE_DIR = os.path.join(dir_path, "datasets/coco_captioning")
 
-def load_coco_data(base_dir=BASE_DIR, max_train=None, pca_features=True):
+class H5FeatureArray(object):
+    """
+    Read-only, array-like view of a 2D HDF5 feature dataset that keeps the file
+    open and only reads the rows that are indexed. Recently used rows are kept
+    in an LRU cache of at most cache_rows rows, so memory scales with the
+    minibatch size rather than with the size of the dataset.
+
+    Indexing with an int or a slice reads straight from the file. Indexing
+    with an array of row indices (as sample_coco_minibatch does) reads the
+    missing rows in a single sorted, de-duplicated h5py read and returns them
+    in the requested order.
+    """
+
+    def __init__(self, filename, key="features", cache_rows=2048):
+        self.filename = filename
+        self.file = h5py.File(filename, "r")
+        self.dset = self.file[key]
+        self.cache_rows = cache_rows
+        self.cache = OrderedDict()
+
+    @property
+    def shape(self):
+        return self.dset.shape
+
+    @property
+    def dtype(self):
+        return self.dset.dtype
+
+    @property
+    def ndim(self):
+        return len(self.dset.shape)
+
+    def __len__(self):
+        return self.dset.shape[0]
+
+    def __getitem__(self, idx):
+        if isinstance(idx, (int, np.integer, slice)):
+            return self.dset[idx]
+        idx = np.asarray(idx)
+        if idx.dtype == bool:
+            idx = np.flatnonzero(idx)
+        idx = np.where(idx < 0, idx + len(self), idx)
+        rows, inverse = np.unique(idx, return_inverse=True)
+
+        missing = np.array([r for r in rows if r not in self.cache], dtype=np.int64)
+        if missing.size > 0:
+            lo, hi = missing[0], missing[-1] + 1
+            if hi - lo <= 2 * missing.size:
+                # Dense enough that one contiguous read beats a point selection
+                block = self.dset[lo:hi][missing - lo]
+            else:
+                block = self.dset[missing]
+            for r, row in zip(missing, block):
+                self.cache[r] = row
+
+        out = np.empty((rows.size,) + self.shape[1:], dtype=self.dtype)
+        for i, r in enumerate(rows):
+            out[i] = self.cache[r]
+            self.cache.move_to_end(r)
+        while len(self.cache) > self.cache_rows:
+            self.cache.popitem(last=False)
+        return out[inverse.reshape(idx.shape)]
+
+    def __array__(self, dtype=None, copy=None):
+        out = self.dset[...]
+        if dtype is not None:
+            out = out.astype(dtype, copy=False)
+        return out
+
+    def close(self):
+        self.cache.clear()
+        self.file.close()
+
+
+def load_coco_data(base_dir=BASE_DIR, max_train=None, pca_features=True, lazy=False):
+    """
+    Load the COCO captioning data into a dictionary.
+
+    If lazy is True, train_features and val_features are H5FeatureArray
+    objects backed by the open HDF5 files instead of in-memory arrays, so
+    startup does not copy the feature matrices into RAM. Everything else in
+    the dictionary is unchanged.
+    """
     print('base dir ', base_dir)
     data = {}
     caption_file = os.path.join(base_dir, "coco2014_captions.h5")
@@ -17,15 +100,21 @@ def load_coco_data(base_dir=BASE_DIR, max_train=None, pca_features=True):
         train_feat_file = os.path.join(base_dir, "train2014_vgg16_fc7_pca.h5")
     else:
         train_feat_file = os.path.join(base_dir, "train2014_vgg16_fc7.h5")
-    with h5py.File(train_feat_file, "r") as f:
-        data["train_features"] = np.asarray(f["features"])
+    if lazy:
+        data["train_features"] = H5FeatureArray(train_feat_file)
+    else:
+        with h5py.File(train_feat_file, "r") as f:
+            data["train_features"] = np.asarray(f["features"])
 
     if pca_features:
         val_feat_file = os.path.join(base_dir, "val2014_vgg16_fc7_pca.h5")
     else:
         val_feat_file = os.path.join(base_dir, "val2014_vgg16_fc7.h5")
-    with h5py.File(val_feat_file, "r") as f:
-        data["val_features"] = np.asarray(f["features"])
+    if lazy:
+        data["val_features"] = H5FeatureArray(val_feat_file)
+    else:
+        with h5py.File(val_feat_file, "r") as f:
+            data["val_features"] = np.asarray(f["features"])
 
     dict_file = os.path.join(base_dir, "coco2014_vocab.json")
     with open(dict_file, "r") as f: